@@ -1,6 +1,10 @@
-import itertools
-import coordinate
+from time import perf_counter
+from coordinate import popcount
+from ordering import makeOrdering
+from stats import SolverStats
+from limits import LimitReached
 from constraint import RCConstraint, ArithmeticConstraint
+from presolve import Presolver
 
 class arcConsistency():
     """
@@ -8,158 +12,467 @@ class arcConsistency():
     Contains methods and procedures needed to solve KenKens via
     arConsistency as a primary means of pruning domains
     """
-    def __init__(self, board):
+    def __init__(self, board, ordering=None, observer=None, limits=None):
         #Just get a local copy of the coordinates, for convenience
         self.board = board
+        #VariableOrdering deciding which coordinate to branch on (see ordering.py)
+        if (ordering == None or isinstance(ordering, str)):
+            ordering = makeOrdering(ordering)
+        self.ordering = ordering
         self.coordinates = []
         for i in range(board.getSize()):
             for coord in board.getRow(i):
                 self.coordinates.append(coord)
+        #Every domain change made by the solver is logged on the trail as
+        #(coordinate, previous domain bits), so backtracking only has to undo
+        #what actually changed below a node
+        self.trail = []
+        #Work counters (see stats.py), and an optional SolverObserver
+        self.stats = SolverStats()
+        self.observer = observer
+        self.depth = 0
+        #Optional SearchLimits (see limits.py), checked at every node
+        self.limits = limits
+        #Whether the search starts with the Presolver's deduction rules (see presolve.py)
+        self.presolve = False
+        #solveWithSAC only probes coordinates with at most this many values (None for all of them)
+        self.probeLimit = None
         #Initialize the Queue
         self.initializeConsistencyQueue()
 
     def initializeConsistencyQueue(self):
         #Add all (Coordiante, Constraint) pairs to the queue to start
         self.consistencyQueue = []
+        queued = set()
         for coord in self.coordinates:
             for constraint in coord.getConstraints():
-                if (coord, constraint) not in self.consistencyQueue:
+                if (coord, constraint) not in queued:
+                    queued.add((coord, constraint))
                     self.consistencyQueue.append((coord, constraint))
- 
+
+    def setDomainBits(self, coord, bits):
+        """
+        Changes coord's domain, recording the old domain on the trail
+        """
+        self.trail.append((coord, coord.getDomainBits()))
+        coord.setDomainBits(bits)
+
+    def narrowDomain(self, coord, bits, constraint):
+        """
+        Called by propagation when constraint cuts coord's domain down to bits
+        """
+        self.setDomainBits(coord, bits)
+
+    def undoTo(self, mark):
+        """
+        Rewinds the trail to mark (a previous len(self.trail)), restoring
+        every domain changed since then
+        """
+        trail = self.trail
+        while (len(trail) > mark):
+            coord, bits = trail.pop()
+            coord.setDomainBits(bits)
+        #A failed propagation can leave pairs behind; they belong to the undone state
+        self.consistencyQueue = []
+
     def arcConsistencyHelper(self):
         """
         The helper function is recurses every time the queue is emptied,
         and a coordinate must be assigned a value.  When the helper function
         finds a solution, it throws a "Solution" exception, which immediately exits all
         recursion and is caught outside the helper function (neat!).
+        Returns False as soon as a domain is wiped out, True otherwise.
         """
-        while (len(self.consistencyQueue) != 0):
-            #Keep looping until all constraints are satisfied, and no more pruning is available
-            currentCoordinate, currentConstraint = self.consistencyQueue.pop(0)
-            relatedCoordinates = [coord for coord in currentConstraint.getCoordinates() if coord != currentCoordinate]
-            for value in currentCoordinate.getDomain():
-                #Find a set of Coordinate assignments that satisfies the Constraint for this value
-                for instance in itertools.product(*[coord.getDomain() for coord in relatedCoordinates]):
-                    if currentConstraint.valuesSatisfyConstraint((value,) + instance):
-                        break
-                #Nothing satisfies? Then prune the value from the domain, and add associated
-                #(Coordinate, Constraint) pairs onto the queue
-                else:
-                    currentCoordinate.removeFromDomain(value)
+        startTime = perf_counter()
+        stats = self.stats
+        try:
+            while (len(self.consistencyQueue) != 0):
+                #Keep looping until all constraints are satisfied, and no more pruning is available
+                currentCoordinate, currentConstraint = self.consistencyQueue.pop(0)
+                stats.revisions += 1
+                #Keep only the values the constraint can still support, and if anything
+                #got pruned add the associated (Coordinate, Constraint) pairs onto the queue
+                domain = currentCoordinate.getDomainBits()
+                supported = domain & currentConstraint.supportedValues(currentCoordinate)
+                if (supported != domain):
+                    self.narrowDomain(currentCoordinate, supported, currentConstraint)
+                    stats.valuesPruned += popcount(domain & ~supported)
+                    if (self.observer != None):
+                        self.observer.onPrune(currentCoordinate, domain & ~supported, currentConstraint)
+                    if (supported == 0):
+                        #No point propagating any further, let the ordering know who failed
+                        self.ordering.constraintFailed(currentConstraint)
+                        if (self.observer != None):
+                            self.observer.onWipeOut(currentCoordinate, currentConstraint)
+                        self.consistencyQueue = []
+                        return False
                     self.addRelatedToQueue(currentCoordinate)
-            #When arcConsistencyHelper terminates, it returns and the board's coordinates and their domains 
-            #have been modified.
+                #When arcConsistencyHelper terminates, it returns and the board's coordinates and their domains 
+                #have been modified.
+            return True
+        finally:
+            stats.addPhaseTime("propagation", startTime)
+
+    def recordSolution(self):
+        """
+        Copies the singleton domains into the Coordinate values.
+        Returns True to end the search here; subclasses that want to keep
+        looking for other solutions can return False instead.
+        """
+        for coordinate in self.board.getCoordinates():
+            coordinate.setValue(coordinate.singletonValue())
+        if (self.observer != None):
+            self.observer.onSolution(self)
+        return True
+
+    def selectCoordinate(self):
+        """
+        Asks the variable ordering for the coordinate to branch on next
+        """
+        startTime = perf_counter()
+        branchCoordinate = self.ordering.selectCoordinate(self)
+        self.stats.addPhaseTime("selection", startTime)
+        return branchCoordinate
+
+    def branch(self, coordinate, value):
+        """
+        Assigns value to coordinate for the branch about to be explored
+        """
+        if (self.observer != None):
+            self.observer.onBranch(coordinate, value, self.depth)
+        self.addRelatedToQueue(coordinate)
+        self.setDomainBits(coordinate, 1 << value)
 
 
     def solve(self):
         """
         Searches for a solution using a combination of arcConsistency
         and backtracking. The Algorithm will run arcConsistency,
-        find the smallest remaining domain (that's greater than 1), and
+        let the variable ordering pick an unassigned coordinate, and
         systematically assign a value to the variable and recurse onwards.
-        Returns True is a solution is found, False otherwise.
+        Returns True is a solution is found, False otherwise, or a (falsy)
+        LimitReached if one of the solver's limits stopped the search.
         """
-        self.arcConsistencyHelper()
-        if self.isSolved():
-            for coordinate in self.board.getCoordinates():
-                coordinate.setValue(coordinate.getDomain()[0])
-            return True
-        elif self.isDeadEnd():
-            return False
-        else:
-            print("selecting a variable to assign")
-            savedDomains = self.backupDomains(self.getListOfDomains())
-            smallest = self.indexOfSmallestDomain(savedDomains)
-            for x in savedDomains[smallest]:
-                self.addRelatedToQueue(self.coordinates[smallest])
-                self.coordinates[smallest].setDomain([x,])
-                if (self.solve()):
-                    return True
-                self.restoreDomains(self.backupDomains(savedDomains))
-            else:
-                return False 
+        return self.runSearch(self.search)
 
     def solveWithLCV(self):
         """
-        Works the same as solveWithBackTracking, but assigns the variable
+        Works the same as solve, but assigns the variable
         in an order such that you assign the least constraining value first.  
         That is, assign the value which would cause the least domain pruning 
         after running arcConsistency.
         """
-        self.arcConsistencyHelper()
-        if self.isSolved():
-            for coordinate in self.board.getCoordinates():
-                coordinate.setValue(coordinate.getDomain()[0])
-            return True
-        elif self.isDeadEnd():
+        return self.runSearch(self.searchWithLCV)
+
+    def solveWithSAC(self):
+        """
+        Works the same as solveWithLCV, but makes every node singleton arc
+        consistent first (see singletonConsistency), so any value left
+        survives propagation when tried on its own
+        """
+        return self.runSearch(self.searchWithSAC)
+
+    def presolveRoot(self):
+        """
+        Alternates the Presolver's rules with arc consistency until neither
+        removes anything.  Returns False if that leaves the puzzle without
+        a solution.
+        """
+        startTime = perf_counter()
+        presolver = Presolver(self)
+        try:
+            while True:
+                if (not presolver.run()):
+                    self.consistencyQueue = []
+                    return False
+                mark = len(self.trail)
+                if (not self.arcConsistencyHelper()):
+                    return False
+                if (len(self.trail) == mark):
+                    return True
+        finally:
+            self.stats.addPhaseTime("presolve", startTime)
+
+    def runSearch(self, search):
+        if (self.limits != None):
+            self.limits.start()
+        try:
+            if (self.presolve and not self.presolveRoot()):
+                return False
+            return search()
+        except LimitReached as limit:
+            #The domains are left as they were when the limit hit
+            self.consistencyQueue = []
+            return limit.record(self)
+
+    def checkLimits(self):
+        if (self.limits != None):
+            self.limits.check(self.stats)
+
+    def search(self):
+        """
+        The recursive part of solve
+        """
+        self.stats.nodes += 1
+        self.checkLimits()
+        self.stats.maxDepth = max(self.stats.maxDepth, self.depth)
+        if (not self.arcConsistencyHelper()):
             return False
+        elif self.isSolved():
+            return self.recordSolution()
         else:
-            savedDomains = self.backupDomains(self.getListOfDomains())
-            smallest = self.indexOfSmallestDomain(savedDomains)
-            resultingDomainsList = []
-            for x in savedDomains[smallest]:
-                self.addRelatedToQueue(self.coordinates[smallest])
-                self.coordinates[smallest].setDomain([x,])
-                self.arcConsistencyHelper()
-                resultingDomainsList.append((x, self.getListOfDomains()))
-                self.restoreDomains(self.backupDomains(savedDomains))
-            for assignment, resultingDomains in resultingDomainsList:
-                for domain in resultingDomains:
-                    if (len(domain) == 0):
-                        resultingDomainsList.remove((assignment, resultingDomains)) #This assignment cannot work
-                        break
-            #compute resulting total domain sizes
-            mappedTotalDomainSizes = list(map(self.totalSizeOfDomains, 
-                                                [domains for assignment, domains in resultingDomainsList]))
-            #pick the assigned variables, ordered by resulting domain size
-            for i in range(len(resultingDomainsList)):
-                currentAssignmentIndex = mappedTotalDomainSizes.index(max(mappedTotalDomainSizes))
-                currentAssignment, currentDomains = resultingDomainsList[currentAssignmentIndex]
-                self.restoreDomains(currentDomains)
-                self.coordinates[smallest].setDomain([currentAssignment,])
-                if (self.solveWithLCV()):
+            mark = len(self.trail)
+            branchCoordinate = self.selectCoordinate()
+            for x in branchCoordinate.getDomain():
+                self.branch(branchCoordinate, x)
+                self.depth += 1
+                solved = self.search()
+                self.depth -= 1
+                if (solved):
                     return True
+                self.stats.backtracks += 1
+                self.undoTo(mark)
             else:
-                return False
+                return False 
+
+    def searchWithLCV(self):
+        """
+        The recursive part of solveWithLCV
+        """
+        self.stats.nodes += 1
+        self.checkLimits()
+        self.stats.maxDepth = max(self.stats.maxDepth, self.depth)
+        if (not self.arcConsistencyHelper()):
+            return False
+        elif self.isSolved():
+            return self.recordSolution()
+        else:
+            branchCoordinate = self.selectCoordinate()
+            return self.branchOnProbes(branchCoordinate, self.probe(branchCoordinate), self.searchWithLCV)
+
+    def searchWithSAC(self):
+        """
+        The recursive part of solveWithSAC
+        """
+        self.stats.nodes += 1
+        self.checkLimits()
+        self.stats.maxDepth = max(self.stats.maxDepth, self.depth)
+        if (not self.arcConsistencyHelper()):
+            return False
+        probed = self.singletonConsistency()
+        if (probed == None):
+            return False
+        elif self.isSolved():
+            return self.recordSolution()
+        branchCoordinate = self.selectCoordinate()
+        if branchCoordinate in probed:
+            return self.branchOnProbes(branchCoordinate, probed[branchCoordinate], self.searchWithSAC)
+        return self.branchOnProbes(branchCoordinate, self.probe(branchCoordinate), self.searchWithSAC)
+
+    def probe(self, coord):
+        """
+        Tries each value of coord on its own and propagates it.  Returns
+        (value, changes, total domain size) for every value that survives,
+        changes being the domains the probe changed (see changesSince), so
+        a branch on that value can replay them instead of propagating
+        again.  Values that wipe out a domain are removed from coord for
+        good, that is until the search backs up past this node.
+        """
+        startTime = perf_counter()
+        stats = self.stats
+        mark = len(self.trail)
+        results = []
+        failed = 0
+        for value in coord.getDomain():
+            stats.probes += 1
+            self.addRelatedToQueue(coord)
+            self.setDomainBits(coord, 1 << value)
+            if (self.arcConsistencyHelper()):
+                results.append((value, self.changesSince(mark), self.totalSizeOfDomains(self.getListOfDomains())))
+            else:
+                failed |= 1 << value
+            self.undoTo(mark)
+        if (failed != 0):
+            self.setDomainBits(coord, coord.getDomainBits() & ~failed)
+            stats.valuesPruned += popcount(failed)
+            stats.probePrunes += popcount(failed)
+            if (self.observer != None):
+                self.observer.onPrune(coord, failed, None)
+        stats.addPhaseTime("probing", startTime)
+        return results
+
+    def singletonConsistency(self):
+        """
+        Probes (see probe) every coordinate with more than one and at most
+        probeLimit values, and propagates whatever the probes removed, round
+        after round until a whole round removes nothing.  Returns the
+        results of that last round by coordinate, all still exact, or None
+        if a domain was wiped out.
+        """
+        while True:
+            probed = {}
+            pruned = False
+            for coord in self.coordinates:
+                size = coord.domainSize()
+                if (size < 2 or (self.probeLimit != None and size > self.probeLimit)):
+                    continue
+                results = self.probe(coord)
+                if (len(results) < size):
+                    if (len(results) == 0):
+                        return None
+                    pruned = True
+                    self.addRelatedToQueue(coord)
+                    if (not self.arcConsistencyHelper()):
+                        return None
+                probed[coord] = results
+            if not pruned:
+                return probed
+
+    def branchOnProbes(self, branchCoordinate, results, search):
+        """
+        Branches on the values of branchCoordinate that survived probe, the
+        least constraining first (the one leaving the most values in all the
+        domains), replaying each probe's changes and recursing with search
+        """
+        mark = len(self.trail)
+        results = sorted(results, key=lambda result: -result[2])
+        for value, changes, size in results:
+            if (self.observer != None):
+                self.observer.onBranch(branchCoordinate, value, self.depth)
+            for coord, bits in changes:
+                self.setDomainBits(coord, bits)
+            self.depth += 1
+            solved = search()
+            self.depth -= 1
+            if (solved):
+                return True
+            self.stats.backtracks += 1
+            self.undoTo(mark)
+        return False
+
+    def iterSolutions(self):
+        """
+        Generator yielding every solution of the board, one at a time, as an
+        immutable tuple of columns (solution[x][y] is the value at (x,y)).
+        Nothing is searched until the next solution is asked for, and the
+        domains are put back the way they were once the generator is
+        finished or closed.  If one of the solver's limits is hit,
+        LimitReached is raised from the generator.
+        """
+        for solution in self.enumerate(True):
+            yield solution
+
+    def countSolutions(self, limit=None):
+        """
+        Returns the number of solutions, stopping as soon as limit of them
+        have been found (so countSolutions(2) == 1 means the solution is
+        unique).  Solutions are counted without being built.
+        If one of the solver's limits is hit, LimitReached is raised.
+        """
+        count = 0
+        solutions = self.enumerate(False)
+        try:
+            for found in solutions:
+                count += 1
+                if (limit != None and count >= limit):
+                    break
+        finally:
+            solutions.close()
+        return count
+
+    def enumerate(self, materialize):
+        if (self.limits != None):
+            self.limits.start()
+        mark = len(self.trail)
+        #Pairs still waiting to be revised are part of the state to restore
+        pendingQueue = list(self.consistencyQueue)
+        try:
+            if (self.presolve and not self.presolveRoot()):
+                return
+            for solution in self.searchAll(materialize):
+                yield solution
+        except LimitReached as limit:
+            limit.record(self)
+            raise
+        finally:
+            self.undoTo(mark)
+            self.consistencyQueue = pendingQueue
+            self.depth = 0
+
+    def searchAll(self, materialize):
+        """
+        The recursive part of iterSolutions and countSolutions
+        """
+        self.stats.nodes += 1
+        self.checkLimits()
+        self.stats.maxDepth = max(self.stats.maxDepth, self.depth)
+        if (not self.arcConsistencyHelper()):
+            return
+        elif self.isSolved():
+            if (self.observer != None):
+                self.observer.onSolution(self)
+            if materialize:
+                size = self.board.getSize()
+                yield tuple(tuple(self.board.getCoordinate(x, y).singletonValue() for y in range(size))
+                                for x in range(size))
+            else:
+                yield True
+            return
+        mark = len(self.trail)
+        branchCoordinate = self.selectCoordinate()
+        for x in branchCoordinate.getDomain():
+            self.branch(branchCoordinate, x)
+            self.depth += 1
+            for solution in self.searchAll(materialize):
+                yield solution
+            self.depth -= 1
+            self.stats.backtracks += 1
+            self.undoTo(mark)
+
+    def changesSince(self, mark):
+        """
+        Returns (coordinate, current domain bits) for every coordinate changed
+        since the trail was at mark, in the order they were first changed
+        """
+        changes = []
+        seen = set()
+        for coord, bits in self.trail[mark:]:
+            if coord not in seen:
+                seen.add(coord)
+                changes.append((coord, coord.getDomainBits()))
+        return changes
 
     def totalSizeOfDomains(self, domains):
         totalSize = 0
         for domain in domains:
-            totalSize += len(domain)
+            totalSize += popcount(domain)
         return totalSize
 
     def getListOfDomains(self):
+        """
+        Returns the domain bitmask of every coordinate, in solver order.
+        Bitmasks are ints, so the returned list is already a snapshot.
+        """
         domains = []
         for coord in self.coordinates:
-            domains.append(coord.getDomain())
+            domains.append(coord.getDomainBits())
         return domains
 
-    def backupDomains(self, domains):
-        domainCopies = []
-        for d in domains:
-            domainCopies.append(coordinate.deepcopy(d))
-        return domainCopies
-
-    def restoreDomains(self, domains):
-        for i in range(len(domains)):
-            self.coordinates[i].setDomain(domains[i])
-
-    def indexOfSmallestDomain(self, domains):
-        smallest = None
-        for i in range(len(domains)):
-            if (smallest == None or ((len(domains[i]) > 1) and (len(domains[i]) > len(domains[smallest])))):
-                smallest = i
-        return smallest
+    def isAssigned(self, coord):
+        """
+        A coordinate counts as assigned once its domain is down to one value
+        """
+        return coord.isSingleton()
 
     def isSolved(self):
-        for domain in self.getListOfDomains():
-            if (len(domain) != 1):
+        for coord in self.coordinates:
+            if (not coord.isSingleton()):
                 return False
         return True
 
     def isDeadEnd(self):
-        for domain in self.getListOfDomains():
-            if (len(domain) == 0):
+        for coord in self.coordinates:
+            if (coord.isEmpty()):
                 return True
         return False
 
@@ -168,6 +481,7 @@ class arcConsistency():
             for relatedCoord in const.getCoordinates():
                 if (relatedCoord, const) not in self.consistencyQueue:
                     self.consistencyQueue.append((relatedCoord, const))
+                    self.stats.queuePushes += 1
 
 
 #Extensions of generic exceptions, used to take advantage
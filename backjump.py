@@ -0,0 +1,352 @@
+from time import perf_counter
+from collections import OrderedDict
+from coordinate import bitsToValues
+from limits import LimitReached
+from constraint import RCConstraint, allDifferentSupports
+from arcConsistency import arcConsistency
+from backtrack import BackTrack
+
+class NogoodStore:
+    """
+    Bounded store of nogoods: sets of (coordinate, value) decisions that
+    were found not to hold together in any solution.  At most maxNogoods
+    are kept, the one that has gone unused the longest being forgotten
+    first, and nogoods of more than maxLength decisions are not kept at
+    all (they hardly ever match again).
+    """
+    def __init__(self, maxNogoods=2000, maxLength=10):
+        self.maxNogoods = maxNogoods
+        self.maxLength = maxLength
+        #nogood -> None, least recently used first
+        self.nogoods = OrderedDict()
+        #(coordinate, value) -> the nogoods that decision is part of (as dict
+        #keys, so they are tried in the order they were learned)
+        self.index = {}
+
+    def __len__(self):
+        return len(self.nogoods)
+
+    def add(self, decisions):
+        """
+        Learns that the (coordinate, value) pairs in decisions cannot all hold
+        """
+        nogood = frozenset(decisions)
+        if (len(nogood) == 0 or len(nogood) > self.maxLength or nogood in self.nogoods):
+            return
+        self.nogoods[nogood] = None
+        for decision in nogood:
+            self.index.setdefault(decision, {})[nogood] = None
+        if (len(self.nogoods) > self.maxNogoods):
+            oldest, unused = self.nogoods.popitem(last=False)
+            for decision in oldest:
+                del self.index[decision][oldest]
+
+    def match(self, coordinate, value, holds):
+        """
+        Returns a nogood that rules out coordinate = value, given that
+        holds(coordinate, value) tells whether a decision currently holds,
+        or None if no nogood does
+        """
+        for nogood in self.index.get((coordinate, value), ()):
+            for otherCoordinate, otherValue in nogood:
+                if (otherCoordinate is not coordinate and not holds(otherCoordinate, otherValue)):
+                    break
+            else:
+                self.nogoods.move_to_end(nogood)
+                return nogood
+        return None
+
+
+def hallSet(coordinates, value):
+    """
+    Returns coordinates from the list (all in one row or column) whose
+    domains only hold as many values as there are coordinates, value among
+    them, so no other coordinate of the line can take value.  Returns None
+    if there is no such set.
+    >>> from coordinate import Coordinate
+    >>> line = [Coordinate(0, 0, 0b0110), Coordinate(0, 1, 0b0110), Coordinate(0, 2, 0b11110)]
+    >>> [coord.getY() for coord in hallSet(line, 2)], hallSet(line, 3)
+    ([0, 1], None)
+    """
+    supports, matching = allDifferentSupports([coord.getDomainBits() for coord in coordinates])
+    if (matching == None or value not in matching):
+        return None
+    ownerOf = dict((matching[i], i) for i in range(len(coordinates)))
+    #Everything the owner of value could be pushed onto, and so on
+    reached = set([ownerOf[value]])
+    frontier = [ownerOf[value]]
+    while (len(frontier) != 0):
+        i = frontier.pop()
+        for other in bitsToValues(coordinates[i].getDomainBits()):
+            if other not in ownerOf:
+                #A free value: value could be handed over after all
+                return None
+            if ownerOf[other] not in reached:
+                reached.add(ownerOf[other])
+                frontier.append(ownerOf[other])
+    return [coordinates[i] for i in sorted(reached)]
+
+
+class BackjumpingSearch(arcConsistency):
+    """
+    arcConsistency with conflict-directed backjumping and nogood learning.
+    Every coordinate carries an explanation: a bitmask of the search levels
+    whose decisions caused the values missing from its domain (bit d is
+    the decision made at depth d).  When propagation wipes out a domain,
+    the explanations of the failing constraint's coordinates make up the
+    conflict.  A level whose decision is not in the conflict of a failed
+    child gets its other values skipped, the search jumping straight back
+    to the deepest level that was involved.  The decisions in the conflict
+    of every exhausted level are learned as a nogood (see NogoodStore),
+    and values matching one are skipped without being searched.
+    """
+    def __init__(self, board, ordering=None, observer=None, limits=None, nogoods=None):
+        arcConsistency.__init__(self, board, ordering, observer, limits)
+        if (nogoods == None):
+            nogoods = NogoodStore()
+        self.nogoods = nogoods
+        self.explanations = dict((coord, 0) for coord in self.coordinates)
+        #Explanations before each trail entry, kept in step with self.trail
+        self.explanationTrail = []
+        #Levels responsible for the domain changes being made right now
+        self.reason = 0
+        #Levels responsible for the last wipe-out
+        self.conflict = 0
+        #(coordinate, value) decided at each level of the current branch
+        self.decisions = []
+
+    def setDomainBits(self, coord, bits):
+        self.explanationTrail.append(self.explanations[coord])
+        self.explanations[coord] |= self.reason
+        arcConsistency.setDomainBits(self, coord, bits)
+
+    def undoTo(self, mark):
+        explanationTrail = self.explanationTrail
+        while (len(explanationTrail) > mark):
+            coord = self.trail[len(explanationTrail) - 1][0]
+            self.explanations[coord] = explanationTrail.pop()
+        arcConsistency.undoTo(self, mark)
+
+    def narrowDomain(self, coord, bits, constraint):
+        """
+        The values constraint removes from coord are explained by whatever
+        removed values from the other coordinates it covers.  For a row or
+        column that is narrowed down to the coordinates of a Hall set (see
+        hallSet), which keeps conflicts small.
+        """
+        others = [other for other in constraint.getCoordinates() if other is not coord]
+        reason = None
+        if (bits != 0 and isinstance(constraint, RCConstraint)):
+            reason = 0
+            for value in bitsToValues(coord.getDomainBits() & ~bits):
+                hall = hallSet(others, value)
+                if (hall == None):
+                    reason = None
+                    break
+                for other in hall:
+                    reason |= self.explanations[other]
+        if (reason == None):
+            reason = 0
+            for other in others:
+                reason |= self.explanations[other]
+        self.reason = reason
+        self.setDomainBits(coord, bits)
+        if (bits == 0):
+            self.conflict = self.explanations[coord]
+
+    def holds(self, coord, value):
+        return coord.getDomainBits() == 1 << value
+
+    def solve(self):
+        """
+        Same as arcConsistency.solve, with backjumping and nogood learning
+        """
+        return self.runSearch(self.searchFromRoot)
+
+    def searchFromRoot(self):
+        return self.backjumpSearch()[0]
+
+    def backjumpSearch(self):
+        """
+        The recursive part of solve.  Returns (solved, conflict) where
+        conflict is the bitmask of levels whose decisions made this
+        subtree fail.
+        """
+        stats = self.stats
+        stats.nodes += 1
+        self.checkLimits()
+        stats.maxDepth = max(stats.maxDepth, self.depth)
+        if (not self.arcConsistencyHelper()):
+            return False, self.conflict
+        elif self.isSolved():
+            return self.recordSolution(), 0
+        mark = len(self.trail)
+        branchCoordinate = self.selectCoordinate()
+        level = self.depth
+        levelBit = 1 << level
+        #Whatever removed the values that are not tried here is part of the failure
+        conflict = self.explanations[branchCoordinate]
+        for x in branchCoordinate.getDomain():
+            nogood = self.nogoods.match(branchCoordinate, x, self.holds)
+            if (nogood != None):
+                stats.nogoodPrunes += 1
+                for coord, value in nogood:
+                    if (coord is not branchCoordinate):
+                        conflict |= self.explanations[coord]
+                continue
+            self.decisions.append((branchCoordinate, x))
+            self.reason = levelBit
+            self.branch(branchCoordinate, x)
+            self.depth += 1
+            solved, childConflict = self.backjumpSearch()
+            self.depth -= 1
+            self.decisions.pop()
+            if (solved):
+                return True, 0
+            stats.backtracks += 1
+            self.undoTo(mark)
+            if not (childConflict & levelBit):
+                #This level's decision played no part, so neither can its other values
+                stats.backjumps += 1
+                return False, childConflict
+            conflict |= childConflict & ~levelBit
+        self.learn(conflict)
+        return False, conflict
+
+    def learn(self, conflict):
+        """
+        Stores the decisions of the levels in conflict as a nogood
+        """
+        self.nogoods.add(self.decisions[level] for level in range(len(self.decisions)) if (conflict >> level) & 1)
+
+
+class BackjumpingBackTrack(BackTrack):
+    """
+    BackTrack, with forward checking, plus conflict-directed backjumping
+    and nogood learning.  Every coordinate carries an explanation, as in
+    BackjumpingSearch: the bitmask of the levels whose assignments removed
+    values from its domain.  A value forward checking removes from a row
+    or column is explained by the level of the assignment alone, one
+    removed from a cage by the levels of the cage's other coordinates
+    (their own level once assigned, their explanation otherwise).  A
+    broken constraint's conflict is the levels its coordinates were
+    assigned at, and a wiped out domain's conflict its explanation; the
+    rest works as in BackjumpingSearch.
+    """
+    def __init__(self, board, ordering=None, observer=None, limits=None, nogoods=None, checkers=None):
+        BackTrack.__init__(self, board, ordering, observer, limits, True, checkers)
+        if (nogoods == None):
+            nogoods = NogoodStore()
+        self.nogoods = nogoods
+        #Level each assigned coordinate was assigned at
+        self.levels = {}
+        self.decisions = []
+        self.explanations = dict((coord, 0) for coord in self.coordinates)
+        #Explanations before each trail entry, kept in step with self.trail
+        self.explanationTrail = []
+        #Levels responsible for the domain changes being made right now
+        self.reason = 0
+        #Levels responsible for the last wiped out domain, or None
+        self.conflict = None
+
+    def holds(self, coord, value):
+        return coord.getValue() == value
+
+    def setDomainBits(self, coord, bits):
+        self.explanationTrail.append(self.explanations[coord])
+        self.explanations[coord] |= self.reason
+        BackTrack.setDomainBits(self, coord, bits)
+
+    def undoTo(self, mark):
+        explanationTrail = self.explanationTrail
+        while (len(explanationTrail) > mark):
+            coord = self.trail[len(explanationTrail) - 1][0]
+            self.explanations[coord] = explanationTrail.pop()
+        BackTrack.undoTo(self, mark)
+
+    def narrowDomain(self, coord, bits, constraint):
+        if not isinstance(constraint, RCConstraint):
+            reason = 0
+            for other in constraint.getCoordinates():
+                if (other is coord):
+                    continue
+                elif other in self.levels:
+                    reason |= 1 << self.levels[other]
+                else:
+                    reason |= self.explanations[other]
+            self.reason = reason
+        BackTrack.narrowDomain(self, coord, bits, constraint)
+        if (bits == 0):
+            self.conflict = self.explanations[coord]
+
+    def solve(self):
+        """
+        Same as BackTrack.solve, with backjumping and nogood learning
+        """
+        if (self.limits != None):
+            self.limits.start()
+        try:
+            solved, conflict = self.backjumpSearch(0)
+            return solved
+        except LimitReached as limit:
+            return limit.record(self)
+
+    def levelsOf(self, coords):
+        levels = 0
+        for coord in coords:
+            if coord in self.levels:
+                levels |= 1 << self.levels[coord]
+        return levels
+
+    def backjumpSearch(self, depth):
+        stats = self.stats
+        stats.nodes += 1
+        if (self.limits != None):
+            self.limits.check(stats)
+        stats.maxDepth = max(stats.maxDepth, depth)
+        if self.isSolved():
+            if (self.observer != None):
+                self.observer.onSolution(self)
+            return True, 0
+        startTime = perf_counter()
+        branchCoordinate = self.ordering.selectCoordinate(self)
+        stats.addPhaseTime("selection", startTime)
+        levelBit = 1 << depth
+        #Whatever removed the values that are not tried here is part of the failure
+        conflict = self.explanations[branchCoordinate]
+        for value in bitsToValues(branchCoordinate.getDomainBits()):
+            nogood = self.nogoods.match(branchCoordinate, value, self.holds)
+            if (nogood != None):
+                stats.nogoodPrunes += 1
+                conflict |= self.levelsOf(coord for coord, v in nogood if coord is not branchCoordinate)
+                continue
+            if (self.observer != None):
+                self.observer.onBranch(branchCoordinate, value, depth)
+            mark = len(self.trail)
+            self.levels[branchCoordinate] = depth
+            #Row and column prunings are down to this assignment alone
+            self.reason = levelBit
+            self.conflict = None
+            broken = self.assign(branchCoordinate, value)
+            if (broken != None):
+                #Counted as a node to keep the stats comparable with arcConsistency's
+                stats.nodes += 1
+                if (self.conflict != None):
+                    childConflict = self.conflict
+                else:
+                    childConflict = self.levelsOf(broken.getCoordinates())
+            else:
+                self.decisions.append((branchCoordinate, value))
+                solved, childConflict = self.backjumpSearch(depth + 1)
+                self.decisions.pop()
+                if (solved):
+                    return True, 0
+            stats.backtracks += 1
+            self.unassign(branchCoordinate, mark)
+            del self.levels[branchCoordinate]
+            if not (childConflict & levelBit):
+                stats.backjumps += 1
+                return False, childConflict
+            conflict |= childConflict & ~levelBit
+        self.nogoods.add(self.decisions[level] for level in range(len(self.decisions)) if (conflict >> level) & 1)
+        return False, conflict
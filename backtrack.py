@@ -1,48 +1,290 @@
+from time import perf_counter
+from coordinate import bitsToValues, popcount
+from constraint import RCConstraint
+from ordering import makeOrdering
+from stats import SolverStats
+from limits import LimitReached
+
 class BackTrack:
-    def __init__(self, board):
+    """
+    Depth first search assigning one coordinate at a time.  Each assignment
+    only checks the constraints of the coordinate just assigned (see
+    brokenAt), including bounds on partly filled cages, and with forward
+    checking (on by default) removes the values it rules out from the
+    domains of the coordinates sharing a constraint with it, so a dead end
+    shows up as soon as a domain is emptied.
+
+    checkers, if given, is the (cells, constraints) pair of the puzzle's
+    generated checkers (see codegen.boardCheckers), which brokenAt then
+    calls instead of checking the constraints itself.
+    """
+    def __init__(self, board, ordering=None, observer=None, limits=None, forwardChecking=True, checkers=None):
         self.board = board
-        self.coordinates = []
-        for i in range(board.getSize()):
-            for coord in board.getRow(i):
-                self.coordinates.append(coord)
+        #VariableOrdering deciding which coordinate to assign next (see ordering.py)
+        if (ordering == None or isinstance(ordering, str)):
+            ordering = makeOrdering(ordering)
+        self.ordering = ordering
+        #Work counters (see stats.py), and an optional SolverObserver
+        self.stats = SolverStats()
+        self.observer = observer
+        #Optional SearchLimits (see limits.py), checked at every node
+        self.limits = limits
+        #Coordinates in board order, which is the order ties are broken in
+        self.coordinates = list(board.getCoordinates())
+        self.forwardChecking = forwardChecking
+        #Domain changes made by forward checking, as (coordinate, previous
+        #domain bits), undone when the assignment that made them is released
+        self.trail = []
+        self.unassigned = len([coord for coord in self.coordinates if coord.getValue() == None])
+        #Generated per-cell checkers (see codegen.py), or None
+        self.checkers = checkers
+        #Values by cell index, kept in step with the Coordinates for the
+        #generated per-cell checkers, if there are any
+        self.values = [coord.getValue() for coord in self.coordinates]
+        self.cellIndex = dict((self.coordinates[i], i) for i in range(len(self.coordinates)))
 
     def solve(self):
-        def solveHelper(index):
-            if (self.isSolved()):
+        """
+        Returns True if a solution is found (it is left in the Coordinate
+        values), False if there is none, or a (falsy) LimitReached if one of
+        the solver's limits stopped the search.
+        """
+        stats = self.stats
+        limits = self.limits
+
+        def solveHelper(depth):
+            stats.nodes += 1
+            if (limits != None):
+                limits.check(stats)
+            stats.maxDepth = max(stats.maxDepth, depth)
+            if self.isSolved():
+                #Every assignment was checked as it was made
+                if (self.observer != None):
+                    self.observer.onSolution(self)
                 return True
-            elif (self.isDeadEnd()):
-                return False
-            else:
-                currentCoordinate = self.board.getCoordinates()[index]
-                for value in currentCoordinate.getDomain():
-                    currentCoordinate.setValue(value)
-                    if (solveHelper(index+1)):
+            startTime = perf_counter()
+            currentCoordinate = self.ordering.selectCoordinate(self)
+            stats.addPhaseTime("selection", startTime)
+            for value in bitsToValues(currentCoordinate.getDomainBits()):
+                if (self.observer != None):
+                    self.observer.onBranch(currentCoordinate, value, depth)
+                mark = len(self.trail)
+                if (self.assign(currentCoordinate, value) == None):
+                    if (solveHelper(depth + 1)):
                         return True
-                    else:
-                        currentCoordinate.releaseValue()
-                return False
+                else:
+                    #Counted as a node to keep the stats comparable with arcConsistency's
+                    stats.nodes += 1
+                stats.backtracks += 1
+                self.unassign(currentCoordinate, mark)
+            return False
 
-        return solveHelper(0)
+        if (limits != None):
+            limits.start()
+        try:
+            return solveHelper(0)
+        except LimitReached as limit:
+            return limit.record(self)
 
-    def isSolved(self):
-        for constraint in self.board.getConstraints():
-            values = []
-            for coord in constraint.getCoordinates():
-                if (coord.getValue() == None):  
-                    return False
-                values.append(coord.getValue())
-            if (not constraint.valuesSatisfyConstraint(values)):
-                return False
-        return True
-
-    def isDeadEnd(self):
-        for constraint in self.board.getConstraints():
-            values = []
-            for coordinate in constraint.getCoordinates():
-                if (coordinate.getValue() == None):
+    def assign(self, coordinate, value):
+        """
+        Sets coordinate to value, checks its constraints (see brokenAt) and,
+        with forward checking, narrows the domains of the unassigned
+        coordinates sharing a constraint with it.  Returns the constraint
+        found broken or that wiped out a domain, or None.  The caller undoes
+        it with unassign(coordinate, mark), mark being len(self.trail)
+        from before the call.
+        """
+        self.setValue(coordinate, value)
+        self.unassigned -= 1
+        startTime = perf_counter()
+        broken = self.brokenAt(coordinate)
+        if (broken == None and self.forwardChecking):
+            broken = self.forwardCheck(coordinate, value)
+        self.stats.addPhaseTime("checking", startTime)
+        if (broken != None):
+            self.ordering.constraintFailed(broken)
+            if (self.observer != None):
+                self.observer.onWipeOut(coordinate, broken)
+        return broken
+
+    def unassign(self, coordinate, mark):
+        self.setValue(coordinate, None)
+        self.unassigned += 1
+        self.undoTo(mark)
+
+    def setValue(self, coordinate, value):
+        """
+        Sets (or with None, releases) coordinate's value
+        """
+        if (value == None):
+            coordinate.releaseValue()
+        else:
+            coordinate.setValue(value)
+        self.values[self.cellIndex[coordinate]] = value
+
+    def undoTo(self, mark):
+        """
+        Rewinds the trail to mark (a previous len(self.trail)), restoring
+        every domain forward checking changed since then
+        """
+        trail = self.trail
+        while (len(trail) > mark):
+            coord, bits = trail.pop()
+            coord.setDomainBits(bits)
+
+    def setDomainBits(self, coord, bits):
+        """
+        Changes coord's domain, recording the old domain on the trail
+        """
+        self.trail.append((coord, coord.getDomainBits()))
+        coord.setDomainBits(bits)
+
+    def narrowDomain(self, coord, bits, constraint):
+        """
+        Called by forward checking when constraint cuts coord's domain down to bits
+        """
+        domain = coord.getDomainBits()
+        self.setDomainBits(coord, bits)
+        self.stats.valuesPruned += popcount(domain & ~bits)
+        if (self.observer != None):
+            self.observer.onPrune(coord, domain & ~bits, constraint)
+
+    def forwardCheck(self, coordinate, value):
+        """
+        Removes value from the rest of coordinate's row and column, and
+        the values no longer in any tuple from the rest of its cage.
+        Returns the constraint that emptied a domain, or None.
+        """
+        bit = 1 << value
+        if (coordinate.getDomainBits() != bit):
+            #Cage supports are taken from the domains, so the assignment must show in them
+            self.setDomainBits(coordinate, bit)
+        for constraint in coordinate.getConstraints():
+            isLine = isinstance(constraint, RCConstraint)
+            for other in constraint.getCoordinates():
+                if (other is coordinate or other.getValue() != None):
+                    continue
+                domain = other.getDomainBits()
+                if isLine:
+                    supported = domain & ~bit
+                else:
+                    supported = domain & constraint.supportedValues(other)
+                if (supported != domain):
+                    self.narrowDomain(other, supported, constraint)
+                    if (supported == 0):
+                        return constraint
+        return None
+
+    def brokenAt(self, coordinate):
+        """
+        Returns a constraint of coordinate (just assigned) that its values
+        so far already break, or None.  Every other constraint was checked
+        when its own coordinates were assigned.  A row or column is broken
+        by a repeated value, a cage once its values are all known and fail,
+        or earlier by the bounds of ArithmeticConstraint.partialValuesFeasible.
+        With generated checkers the cell's own checker does all of that.
+        """
+        checkers = self.checkers
+        if (checkers != None):
+            cellChecks, constraints = checkers
+            cell = self.cellIndex[coordinate]
+            self.stats.constraintChecks += len(coordinate.getConstraints())
+            broken = cellChecks[cell](self.values)
+            if (broken < 0):
+                return None
+            return constraints[broken]
+        value = coordinate.getValue()
+        for constraint in coordinate.getConstraints():
+            values = [coord.getValue() for coord in constraint.getCoordinates()]
+            self.stats.constraintChecks += 1
+            if isinstance(constraint, RCConstraint):
+                if (values.count(value) > 1):
+                    return constraint
+            elif None in values:
+                if (not constraint.partialValuesFeasible(values)):
+                    return constraint
+            elif (not constraint.valuesSatisfyConstraint(values)):
+                return constraint
+        return None
+
+    def iterSolutions(self):
+        """
+        Generator yielding every solution, one at a time, as an immutable
+        tuple of columns (solution[x][y] is the value at (x,y)).  Values are
+        released again once the generator is finished or closed.  If one of
+        the solver's limits is hit, LimitReached is raised from the generator.
+        """
+        for solution in self.enumerate(True):
+            yield solution
+
+    def countSolutions(self, limit=None):
+        """
+        Returns the number of solutions, stopping once limit have been found.
+        Solutions are counted without being built.
+        If one of the solver's limits is hit, LimitReached is raised.
+        """
+        count = 0
+        solutions = self.enumerate(False)
+        try:
+            for found in solutions:
+                count += 1
+                if (limit != None and count >= limit):
                     break
-                values.append(coordinate.getValue())
+        finally:
+            solutions.close()
+        return count
+
+    def enumerate(self, materialize):
+        if (self.limits != None):
+            self.limits.start()
+        mark = len(self.trail)
+        try:
+            for solution in self.searchAll(materialize, 0):
+                yield solution
+        except LimitReached as limit:
+            limit.record(self)
+            raise
+        finally:
+            for coord in self.coordinates:
+                self.setValue(coord, None)
+            self.undoTo(mark)
+            self.unassigned = len(self.coordinates)
+
+    def searchAll(self, materialize, depth):
+        """
+        The recursive part of iterSolutions and countSolutions
+        """
+        stats = self.stats
+        stats.nodes += 1
+        if (self.limits != None):
+            self.limits.check(stats)
+        stats.maxDepth = max(stats.maxDepth, depth)
+        if self.isSolved():
+            if (self.observer != None):
+                self.observer.onSolution(self)
+            if materialize:
+                size = self.board.getSize()
+                yield tuple(tuple(self.board.getCoordinate(x, y).getValue() for y in range(size))
+                                for x in range(size))
             else:
-                if (not constraint.valuesSatisfyConstraint(values)):
-                    return True
-        return False
+                yield True
+            return
+        currentCoordinate = self.ordering.selectCoordinate(self)
+        for value in bitsToValues(currentCoordinate.getDomainBits()):
+            mark = len(self.trail)
+            if (self.assign(currentCoordinate, value) == None):
+                for solution in self.searchAll(materialize, depth + 1):
+                    yield solution
+            stats.backtracks += 1
+            self.unassign(currentCoordinate, mark)
+
+    def isAssigned(self, coord):
+        return coord.getValue() != None
+
+    def isSolved(self):
+        """
+        True IFF every coordinate is assigned; assign checks each
+        assignment against its constraints as it is made
+        """
+        return self.unassigned == 0
@@ -0,0 +1,209 @@
+#############################################################
+# Batch KenKen solving                                      #
+#                                                           #
+# Solves many puzzles on a pool of worker processes and     #
+# writes one JSON object per puzzle (JSON Lines):           #
+#   {"puzzle": ..., "status": ..., "solution": ...,         #
+#    "seconds": ...}                                        #
+# status is "solved", "unsolved", "error" (with an          #
+# "error" message), or the reason a -t/-n limit stopped     #
+# the solve.  solution[x][y] is the value at (x,y), or      #
+# null when there is none.  With -k, puzzles already in the #
+# solution cache (see cache.py) get "cached": true and are  #
+# not solved again.                                         #
+#                                                           #
+# Usage:                                                    #
+#   python batch.py [-m METHOD] [-v ORDERING]               #
+#       [-t TIMEOUT] [-n NODES] [-k CACHEFILE]              #
+#       [-p PROCESSES] [-c CHUNKSIZE] [-o OUTPUT] SOURCE... #
+# where each SOURCE is a directory of .kk files, a glob     #
+# pattern, a .kk file, a .kkc corpus (see corpus.py), or - #
+# for a stream of puzzles on stdin (each puzzle starts with #
+# its size line)                                            #
+#############################################################
+
+import sys
+import os
+import glob
+import json
+import multiprocessing
+from time import perf_counter
+import kenken
+import corpus
+import model
+from limits import SearchLimits
+from cache import SolutionCache
+
+#Each worker process opens its own connection to the cache file
+workerCaches = {}
+
+def splitPuzzleStream(lines):
+    """
+    Splits the lines of several concatenated KenKen layouts into one list
+    of lines per puzzle.  A puzzle starts at every line holding a lone
+    integer (the board size), since constraint lines always start with
+    an operation name.
+    >>> [len(p) for p in splitPuzzleStream(["2", "div 2 (0,0) (0,1)", "add 3 (1,0) (1,1)", "", "1", "con 1 (0,0)"])]
+    [3, 2]
+    """
+    puzzle = None
+    for line in lines:
+        stripped = line.strip()
+        if (stripped == ''):
+            continue
+        if stripped.isdigit():
+            if (puzzle != None):
+                yield puzzle
+            puzzle = []
+        elif (puzzle == None):
+            raise ValueError("line: " + stripped + "...Error: puzzle stream must start with a board size")
+        puzzle.append(stripped)
+    if (puzzle != None):
+        yield puzzle
+
+def iterPuzzles(sources, stream=None):
+    """
+    Yields (name, lines) for every puzzle named by sources.
+    Directories give their .kk files, - reads a puzzle stream from stream
+    (stdin by default), and anything else is treated as a glob pattern.
+    Puzzles from corpus files come already parsed, so for them lines is
+    the (size, constraints) tuple from kenken.parsePuzzle instead.
+    """
+    for source in sources:
+        if (source == "-"):
+            if (stream == None):
+                stream = sys.stdin
+            for i, lines in enumerate(splitPuzzleStream(stream)):
+                yield ("-#" + str(i), lines)
+            continue
+        if os.path.isdir(source):
+            filenames = glob.glob(os.path.join(source, "*.kk"))
+        else:
+            filenames = glob.glob(source)
+        for filename in sorted(filenames):
+            if corpus.isCorpus(filename):
+                reader = corpus.CorpusReader(filename)
+                try:
+                    for i, puzzle in enumerate(reader):
+                        yield (filename + "#" + str(i), puzzle)
+                finally:
+                    reader.close()
+                continue
+            kkFile = open(filename)
+            lines = kkFile.readlines()
+            kkFile.close()
+            yield (filename, lines)
+
+def solvePuzzle(job):
+    """
+    Runs in a worker process: job is (name, lines, method, ordering, limits,
+    cachePath) where limits is a SearchLimits or None and cachePath names
+    a SolutionCache file, or is None for no cache.  lines can also be an
+    already parsed puzzle, as iterPuzzles yields for corpus files.
+    Returns the result dictionary for that puzzle.
+    """
+    name, lines, method, ordering, limits, cachePath = job
+    startTime = perf_counter()
+    result = {"puzzle": name}
+    try:
+        if isinstance(lines, tuple):
+            puzzle = lines
+        else:
+            puzzle = kenken.parsePuzzle(lines)
+        cache = None
+        if (cachePath != None):
+            if cachePath not in workerCaches:
+                workerCaches[cachePath] = SolutionCache(cachePath)
+            cache = workerCaches[cachePath]
+            found, solution, stats = cache.get(puzzle)
+            if found:
+                result["status"] = "unsolved" if solution == None else "solved"
+                result["solution"] = None if solution == None else [list(column) for column in solution]
+                result["cached"] = True
+                result["seconds"] = perf_counter() - startTime
+                return result
+        solved = model.CompiledPuzzle(puzzle).solve(method, ordering, limits)
+        result["status"] = solved.status
+        result["solution"] = None
+        if solved.solved:
+            result["solution"] = [list(column) for column in solved.solution]
+        if (solved.limit != None):
+            result["nodes"] = solved.stats.nodes
+        elif (cache != None):
+            cache.put(puzzle, result["solution"], solved.stats.asDict())
+    except Exception as e:
+        result["status"] = "error"
+        result["solution"] = None
+        result["error"] = str(e)
+    result["seconds"] = perf_counter() - startTime
+    return result
+
+def solveBatch(puzzles, method=None, ordering=None, processes=None, chunksize=8, limits=None, cachePath=None):
+    """
+    Solves every (name, lines) in puzzles on a pool of processes, handing
+    them out chunksize at a time, and yields result dictionaries in the
+    same order as puzzles.  processes defaults to one per CPU, limits
+    is an optional SearchLimits applied to each puzzle separately, and
+    cachePath an optional SolutionCache file shared by the workers.
+    """
+    jobs = ((name, lines, method, ordering, limits, cachePath) for name, lines in puzzles)
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap(solvePuzzle, jobs, chunksize):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+def parseArguments(args):
+    """
+    Splits batch.py's arguments into a dictionary of flag -> value and
+    the list of sources
+    """
+    options = {}
+    sources = []
+    i = 0
+    while (i < len(args)):
+        if args[i] in ("-m", "-v", "-t", "-n", "-k", "-p", "-c", "-o"):
+            if (i + 1 == len(args)):
+                raise ValueError("option " + args[i] + " needs a value")
+            options[args[i]] = args[i+1]
+            i += 2
+        else:
+            sources.append(args[i])
+            i += 1
+    if (len(sources) == 0):
+        raise ValueError("usage: batch.py [-m METHOD] [-v ORDERING] [-t TIMEOUT] [-n NODES] [-k CACHEFILE] "
+                         "[-p PROCESSES] [-c CHUNKSIZE] [-o OUTPUT] SOURCE...")
+    return options, sources
+
+def main(args):
+    options, sources = parseArguments(args)
+    processes = options.get("-p")
+    if (processes != None):
+        processes = int(processes)
+    chunksize = int(options.get("-c", 8))
+    limits = None
+    if ("-t" in options or "-n" in options):
+        timeout = options.get("-t")
+        if (timeout != None):
+            timeout = float(timeout)
+        maxNodes = options.get("-n")
+        if (maxNodes != None):
+            maxNodes = int(maxNodes)
+        limits = SearchLimits(timeout=timeout, maxNodes=maxNodes)
+    if ("-o" in options):
+        output = open(options["-o"], "w")
+    else:
+        output = sys.stdout
+    try:
+        results = solveBatch(iterPuzzles(sources), options.get("-m"), options.get("-v"),
+                             processes, chunksize, limits, options.get("-k"))
+        for result in results:
+            output.write(json.dumps(result) + "\n")
+    finally:
+        if (output != sys.stdout):
+            output.close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
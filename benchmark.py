@@ -1,68 +1,228 @@
-from time import time
-import kenken
-import os
-import sys
+#############################################################
+# KenKen solver benchmark and regression suite              #
+#                                                           #
+# Every puzzle x method pair is run in its own worker       #
+# process: a few warmup solves, then timed solves, each     #
+# with a timeout.  Medians, percentiles and work counts     #
+# can be saved as a JSON baseline, and later runs compared  #
+# against that baseline to flag regressions.                #
+#                                                           #
+# Usage:                                                    #
+#   python benchmark.py [PUZZLE.kk ...] [-m METHODS]        #
+#       [-r RUNS] [-w WARMUPS] [-t TIMEOUT]                 #
+#       [-s SAVE.json] [-b BASELINE.json] [-x THRESHOLD]    #
+#       [-y NODETHRESHOLD]                                  #
+# PUZZLE names are looked up in puzzles/ and METHODS is a   #
+# comma separated list.  THRESHOLD is the fraction a median #
+# may grow by before it counts as a regression (0.25), and  #
+# NODETHRESHOLD the same for node counts (0.1).             #
+#############################################################
 
+import sys
+import json
+import multiprocessing
+import queue
+from time import perf_counter
+import kenken
+import vectorized
+from stats import percentile
 
-#Globals for StandardOutput and DevNull files for writing to
-#These toggle print statements essentially
-stdout = sys.stdout
-devnull = open(os.devnull, 'w')
 puzzleDir = "puzzles/"
-implementedSolvingMethods = ["arcCon", "arcConLCV", "backTrack"] 
+implementedSolvingMethods = ["arcCon", "arcConLCV", "arcConSAC", "arcConPresolve", "arcConRestarts",
+                             "arcConCBJ", "backTrack", "backTrackCBJ"]
+if (vectorized.numpy != None):
+    implementedSolvingMethods.append("vectorized")
+
+fullBenchmarkPuzzles = ["nyt4x4.kk", "nyt6x6_04-26.kk", "nyt6x6_04-27.kk", "nyt6x6_05-01.kk",
+                        "medium6x6.kk", "hard8x8.kk", "uberhard9x9.kk"]
+
+def benchmarkWorker(puzzleFileName, method, runs, warmups, results):
+    """
+    Worker process: solves the puzzle warmups + runs times, each on a freshly
+    built board, and puts one (seconds, stats dictionary, solved) tuple on
+    results per timed run.  Warmup runs fill memoized tables like the cage
+    tuple tables, so the timed runs see a warm process.  If anything goes
+    wrong (a bad puzzle file, an unknown method), puts ("error", message)
+    instead and stops.
+    """
+    try:
+        for i in range(warmups + runs):
+            kenkenBoard = kenken.buildBoard(puzzleFileName)
+            solver, solveIt = kenken.createSolver(kenkenBoard, method)
+            startTime = perf_counter()
+            solved = solveIt()
+            seconds = perf_counter() - startTime
+            if (i >= warmups):
+                results.put((seconds, solver.stats.asDict(), solved))
+    except Exception as error:
+        results.put(("error", str(error)))
+
+def benchmarkPair(puzzleFileName, method, runs=5, warmups=1, timeout=10.0):
+    """
+    Benchmarks one puzzle with one method and returns a dictionary of results.
+    If any run (warmup included) takes longer than timeout seconds, the worker
+    is killed and the pair is reported as timed out.  If the worker fails,
+    the summary's "error" holds its message.
+    """
+    results = multiprocessing.Queue()
+    worker = multiprocessing.Process(target=benchmarkWorker,
+                                     args=(puzzleFileName, method, runs, warmups, results))
+    worker.daemon = True
+    worker.start()
+    timedRuns = []
+    timedOut = False
+    error = None
+    try:
+        #Warmups share the timeout of the first timed run
+        for i in range(runs):
+            try:
+                run = results.get(timeout=timeout * (1 + (warmups if i == 0 else 0)))
+            except queue.Empty:
+                timedOut = True
+                break
+            if (run[0] == "error"):
+                error = run[1]
+                break
+            timedRuns.append(run)
+    finally:
+        if worker.is_alive():
+            worker.terminate()
+        worker.join()
 
-fullBenchmarkPuzzles = ["nyt4x4.kk", "nyt6x6_04-26.kk", "nyt6x6_04-27.kk", "nyt6x6_05-01.kk", 
-                        "medium6x6.kk", "hard8x8.kk"] 
+    summary = {"puzzle": puzzleFileName, "method": method, "runs": len(timedRuns),
+               "timedOut": timedOut}
+    if (error != None):
+        summary["error"] = error
+    if (len(timedRuns) != 0):
+        seconds = sorted(run[0] for run in timedRuns)
+        summary["median"] = percentile(seconds, 0.5)
+        summary["p90"] = percentile(seconds, 0.9)
+        summary["min"] = seconds[0]
+        summary["max"] = seconds[-1]
+        summary["nodes"] = timedRuns[0][1]["nodes"]
+        summary["revisions"] = timedRuns[0][1]["revisions"]
+        summary["stats"] = timedRuns[0][1]
+        summary["solved"] = all(run[2] for run in timedRuns)
+    return summary
+
+def runBenchmark(puzzles, methods, runs=5, warmups=1, timeout=10.0):
+    """
+    Benchmarks every puzzle x method pair, printing a line for each,
+    and returns the list of result dictionaries
+    """
+    summaries = []
+    for puzzle in puzzles:
+        for method in methods:
+            summary = benchmarkPair(puzzleDir + puzzle, method, runs, warmups, timeout)
+            summaries.append(summary)
+            print(formatSummary(summary))
+    return summaries
+
+def formatSummary(summary):
+    name = summary["puzzle"] + " " + summary["method"]
+    if ("error" in summary):
+        return name + ": error: " + summary["error"]
+    if (summary["runs"] == 0):
+        return name + ": timed out"
+    line = name + ": median " + "%.4f" % summary["median"] + "s, p90 " + "%.4f" % summary["p90"] + "s"
+    line += ", " + str(summary["nodes"]) + " nodes, " + str(summary["revisions"]) + " revisions"
+    if summary["timedOut"]:
+        line += " (timed out after " + str(summary["runs"]) + " runs)"
+    if (not summary["solved"]):
+        line += " (NO SOLUTION)"
+    return line
+
+def saveBaseline(summaries, filename):
+    baseline = open(filename, "w")
+    json.dump(summaries, baseline, indent=2)
+    baseline.close()
+
+def loadBaseline(filename):
+    baseline = open(filename)
+    summaries = json.load(baseline)
+    baseline.close()
+    return summaries
+
+def compareToBaseline(summaries, baseline, threshold=0.25, nodeThreshold=0.1):
+    """
+    Returns a list of messages, one per regression: a median more than
+    threshold (as a fraction) slower than the baseline's, a pair that now
+    times out or finds no solution, or a pair that now needs more than
+    nodeThreshold (as a fraction) more nodes.  Pairs missing from the
+    baseline, and pairs that failed with an error in either, are skipped.
+    """
+    baselineByPair = {}
+    for summary in baseline:
+        baselineByPair[(summary["puzzle"], summary["method"])] = summary
+    regressions = []
+    for summary in summaries:
+        name = summary["puzzle"] + " " + summary["method"]
+        old = baselineByPair.get((summary["puzzle"], summary["method"]))
+        if (old == None or "error" in summary or "error" in old):
+            continue
+        if (summary["runs"] == 0):
+            if (old["runs"] != 0):
+                regressions.append(name + ": now times out")
+            continue
+        if (old["runs"] == 0):
+            continue
+        if (not summary["solved"] and old["solved"]):
+            regressions.append(name + ": no longer finds a solution")
+        if (summary["median"] > old["median"] * (1 + threshold)):
+            regressions.append(name + ": median " + "%.4f" % summary["median"] + "s vs " +
+                               "%.4f" % old["median"] + "s in baseline")
+        if (summary["nodes"] > old["nodes"] * (1 + nodeThreshold)):
+            regressions.append(name + ": " + str(summary["nodes"]) + " nodes vs " +
+                               str(old["nodes"]) + " in baseline")
+    return regressions
 
 def beginFullBenchmark():
     """
-    Solves a series of KenKen puzzles, and times them, giving the times
-    as puzzles are solved.
+    Benchmarks every puzzle in fullBenchmarkPuzzles with every method
     """
-    
-    #FOLLOW THIS FORMAT FOR ADDING TESTS TO THIS BENCHMARKING FILE
-    print("puzzles take longer and longer to solve, Ctrl-C may be necessary in time")
-    for puzzle in fullBenchmarkPuzzles:
-        for method in implementedSolvingMethods:
-            currentPuzzle = "nyt6x6_05-01.kk"
-            printing(False)
-            startTime = time()
-            kenken.main(puzzleDir + currentPuzzle, method)
-            stopTime = time()
-            printing(True)
-            print(currentPuzzle + " solved in " + str(stopTime - startTime) + " seconds using " + method)
-        
-
-    
+    return runBenchmark(fullBenchmarkPuzzles, implementedSolvingMethods)
 
 def beginSingleBenchmark(filename):
-    for method in implementedSolvingMethods:
-        printing(False)
-        startTime = time()
-        kenken.main(puzzleDir + filename, method)
-        stopTime = time()
-        printing(True)
-        print(filename + " solved in " + str(stopTime - startTime) + " seconds")
-
- 
-    
-def printing(b):
+    return runBenchmark([filename], implementedSolvingMethods)
+
+def parseArguments(args):
     """
-    If True, enables printing
-    If False, disables printing (printing gets sent to nothingness... the great null)
+    Splits benchmark.py's arguments into a dictionary of flag -> value
+    and the list of puzzles
     """
-    if b:
-        sys.stdout = stdout
-    else:
-        sys.stdout = devnull
-        
+    options = {}
+    puzzles = []
+    i = 0
+    while (i < len(args)):
+        if args[i] in ("-m", "-r", "-w", "-t", "-s", "-b", "-x", "-y"):
+            if (i + 1 == len(args)):
+                raise ValueError("option " + args[i] + " needs a value")
+            options[args[i]] = args[i+1]
+            i += 2
+        else:
+            puzzles.append(args[i])
+            i += 1
+    return options, puzzles
+
+def main(args):
+    options, puzzles = parseArguments(args)
+    if (len(puzzles) == 0):
+        puzzles = fullBenchmarkPuzzles
+    methods = implementedSolvingMethods
+    if ("-m" in options):
+        methods = options["-m"].split(",")
+    summaries = runBenchmark(puzzles, methods, int(options.get("-r", 5)),
+                             int(options.get("-w", 1)), float(options.get("-t", 10.0)))
+    if ("-s" in options):
+        saveBaseline(summaries, options["-s"])
+    if ("-b" in options):
+        regressions = compareToBaseline(summaries, loadBaseline(options["-b"]),
+                                        float(options.get("-x", 0.25)), float(options.get("-y", 0.1)))
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if (len(regressions) != 0):
+            return 1
+    return 0
 
-    
 if __name__ == "__main__":
-    try:
-        if (sys.argv[1]):
-            beginSingleBenchmark(sys.argv[1])
-            exit()
-    except IndexError:
-        pass
-    beginFullBenchmark()
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,122 @@
+import sqlite3
+import hashlib
+import json
+
+#The 8 symmetries of the square board.  Each maps (x, y) on a board of
+#size n to where the cell ends up; every one of them turns a valid
+#KenKen into another valid KenKen with the same cages, moved.
+symmetries = [
+    lambda x, y, n: (x, y),
+    lambda x, y, n: (y, x),
+    lambda x, y, n: (y, n-1-x),
+    lambda x, y, n: (n-1-x, n-1-y),
+    lambda x, y, n: (n-1-y, x),
+    lambda x, y, n: (n-1-x, y),
+    lambda x, y, n: (x, n-1-y),
+    lambda x, y, n: (n-1-y, n-1-x),
+]
+
+def canonicalForm(puzzle):
+    """
+    Returns (key, symmetry) for a puzzle as returned by kenken.parsePuzzle.
+    key is a hash that is the same for every puzzle that only differs by
+    the order of its cage lines, the order of the cells within a cage, or
+    a rotation, reflection or transposition of the board.  symmetry is the
+    index in symmetries of the transformation that takes this puzzle to
+    the canonical one.
+    >>> def kkAdd(*args): return sum(args)
+    >>> a = canonicalForm((2, [(kkAdd, 3, [(0,0), (0,1)]), (kkAdd, 3, [(1,0), (1,1)])]))
+    >>> b = canonicalForm((2, [(kkAdd, 3, [(1,1), (0,1)]), (kkAdd, 3, [(0,0), (1,0)])]))
+    >>> a[0] == b[0]
+    True
+    """
+    size, constraints = puzzle
+    best = None
+    bestSymmetry = None
+    for i in range(len(symmetries)):
+        transform = symmetries[i]
+        cages = sorted((func.__name__, result, tuple(sorted(transform(x, y, size) for x, y in locations)))
+                        for func, result, locations in constraints)
+        form = repr((size, cages))
+        if (best == None or form < best):
+            best = form
+            bestSymmetry = i
+    return hashlib.sha256(best.encode("utf-8")).hexdigest(), bestSymmetry
+
+def toCanonicalSolution(solution, symmetry):
+    """
+    Moves a solution (solution[x][y]) into the canonical puzzle's frame
+    """
+    size = len(solution)
+    moved = [[None] * size for i in range(size)]
+    for x in range(size):
+        for y in range(size):
+            cx, cy = symmetries[symmetry](x, y, size)
+            moved[cx][cy] = solution[x][y]
+    return moved
+
+def fromCanonicalSolution(moved, symmetry):
+    """
+    Undoes toCanonicalSolution
+    """
+    size = len(moved)
+    return tuple(tuple(moved[symmetries[symmetry](x, y, size)[0]][symmetries[symmetry](x, y, size)[1]]
+                        for y in range(size)) for x in range(size))
+
+
+class SolutionCache:
+    """
+    Persistent puzzle -> solution cache in an SQLite file, keyed by the
+    canonical form of the puzzle, so a rotated or reordered copy of a cached
+    puzzle is a hit too.  Holds at most maxEntries puzzles; the least
+    recently used ones are evicted first.
+    Puzzles without a solution are cached as well, with solution None.
+    """
+    def __init__(self, path, maxEntries=100000):
+        self.maxEntries = maxEntries
+        #Several worker processes may share the file, so wait on locks a while
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS solutions ("
+                                "key TEXT PRIMARY KEY, solution TEXT, stats TEXT, lastUsed INTEGER)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS solutionsByUse ON solutions (lastUsed)")
+        self.connection.commit()
+
+    def nextUse(self):
+        row = self.connection.execute("SELECT MAX(lastUsed) FROM solutions").fetchone()
+        return (row[0] or 0) + 1
+
+    def get(self, puzzle):
+        """
+        Returns (found, solution, stats) for a puzzle as returned by
+        kenken.parsePuzzle.  solution is a tuple of columns, or None if the
+        puzzle is cached as having no solution; stats is the dictionary
+        stored with it.
+        """
+        key, symmetry = canonicalForm(puzzle)
+        row = self.connection.execute("SELECT solution, stats FROM solutions WHERE key = ?", (key,)).fetchone()
+        if (row == None):
+            return False, None, None
+        self.connection.execute("UPDATE solutions SET lastUsed = ? WHERE key = ?", (self.nextUse(), key))
+        self.connection.commit()
+        moved = json.loads(row[0])
+        if (moved != None):
+            moved = fromCanonicalSolution(moved, symmetry)
+        return True, moved, json.loads(row[1])
+
+    def put(self, puzzle, solution, stats=None):
+        """
+        Stores a puzzle's solution (or None for no solution) and stats,
+        then evicts the least recently used entries over maxEntries
+        """
+        key, symmetry = canonicalForm(puzzle)
+        moved = None
+        if (solution != None):
+            moved = toCanonicalSolution(solution, symmetry)
+        self.connection.execute("INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?)",
+                                (key, json.dumps(moved), json.dumps(stats), self.nextUse()))
+        self.connection.execute("DELETE FROM solutions WHERE key IN (SELECT key FROM solutions "
+                                "ORDER BY lastUsed DESC LIMIT -1 OFFSET ?)", (self.maxEntries,))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
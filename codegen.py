@@ -0,0 +1,272 @@
+#############################################################
+# Generated constraint checkers                             #
+#                                                           #
+# Turns a parsed puzzle into Python source with the         #
+# puzzle's checks unrolled and its cage targets inlined as  #
+# integer arithmetic: cell<k> checks every constraint of    #
+# cell k right after it is assigned, reading the values of  #
+# the whole board from one flat list.  BackTrack and        #
+# BackjumpingBackTrack call it instead of brokenAt's        #
+# generic loop when they are given the checkers; no other   #
+# solver uses them.                                         #
+# Generated modules are written to a code cache directory,  #
+# named by a hash of the puzzle, and loaded with importlib, #
+# so a puzzle solved again (even by another process) skips  #
+# the generation.                                           #
+#                                                           #
+# Used with -g CODEDIR in kenken.py, or                     #
+# CompiledPuzzle.solve(checkers=CODEDIR) in model.py.       #
+#                                                           #
+# Usage:                                                    #
+#   python codegen.py PUZZLE.kk                             #
+# prints the source generated for the puzzle.               #
+#############################################################
+
+import sys
+import os
+import stat
+import hashlib
+import tempfile
+import importlib.util
+import kenken
+
+#Bumped whenever the generated source changes, so stale modules are not loaded
+FORMAT = 2
+
+#Checker modules already loaded, by puzzle key
+loadedCheckers = {}
+
+def defaultCodeDirectory():
+    """
+    Returns the current user's own code cache directory under the
+    temporary directory
+    """
+    name = "kenken-checkers"
+    if hasattr(os, "getuid"):
+        name += "-" + str(os.getuid())
+    return os.path.join(tempfile.gettempdir(), name)
+
+def checkPrivate(path):
+    """
+    Raises PermissionError unless path (not a symbolic link) belongs to
+    the current user and nobody else can write to it, since any module in
+    the code cache directory gets run
+    """
+    if not hasattr(os, "getuid"):
+        return
+    info = os.lstat(path)
+    if (stat.S_ISLNK(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o022):
+        raise PermissionError("Error: " + path + " must belong to the current user and not be writable by others")
+
+def privateDirectory(codeDirectory):
+    """
+    Creates codeDirectory with mode 0700 if it does not exist yet, and
+    makes sure nobody else can write modules into it (see checkPrivate)
+    """
+    if not os.path.lexists(codeDirectory):
+        os.makedirs(codeDirectory, 0o700)
+    checkPrivate(codeDirectory)
+
+def puzzleKey(puzzle):
+    """
+    Returns a hash identifying a puzzle (as returned by kenken.parsePuzzle)
+    exactly, cage order and cell order included, since the generated
+    checkers depend on both
+    """
+    size, constraints = puzzle
+    form = repr((FORMAT, size, [(func.__name__, result, [tuple(location) for location in locations])
+                                for func, result, locations in constraints]))
+    return hashlib.sha256(form.encode("utf-8")).hexdigest()
+
+def cageCheck(operation, result, names):
+    """
+    Returns the expression checking a cage whose values are held by the
+    given names, matching the kk* operation functions (sub, div and con
+    only look at their first values, as those do)
+    >>> cageCheck("kkDiv", 3, ["a", "b"])
+    'a == b * 3 or b == a * 3'
+    """
+    result = str(result)
+    if (operation == "kkAdd"):
+        return " + ".join(names) + " == " + result
+    elif (operation == "kkMul"):
+        return " * ".join(names) + " == " + result
+    elif (operation == "kkSub" and len(names) >= 2):
+        return names[0] + " - " + names[1] + " == " + result + " or " + names[1] + " - " + names[0] + " == " + result
+    elif (operation == "kkDiv" and len(names) >= 2):
+        #Integer form of kkDiv's float quotient
+        return names[0] + " == " + names[1] + " * " + result + " or " + names[1] + " == " + names[0] + " * " + result
+    elif (operation == "kkCon" and len(names) >= 1):
+        return names[0] + " == " + result
+    return "False"
+
+def partialCheck(operation, result, known, unknown, size):
+    """
+    Returns the expression for the partial check of an add or mul cage
+    (see ArithmeticConstraint.partialValuesFeasible), given the names
+    known to hold values and the names that may be None, or None for
+    other operations
+    >>> partialCheck("kkAdd", 9, ["v"], ["a"], 4)
+    '(v + (a or 0)) + ((a is None)) <= 9 <= (v + (a or 0)) + ((a is None)) * 4'
+    """
+    if (operation != "kkAdd" and operation != "kkMul"):
+        return None
+    isAdd = operation == "kkAdd"
+    terms = list(known) + ["(" + name + (" or 0)" if isAdd else " or 1)") for name in unknown]
+    total = "(" + (" + " if isAdd else " * ").join(terms) + ")"
+    remaining = "(" + " + ".join("(" + name + " is None)" for name in unknown) + ")"
+    if isAdd:
+        return total + " + " + remaining + " <= " + str(result) + " <= " + total + " + " + remaining + " * " + str(size)
+    powers = "(" + ", ".join(str(size ** i) for i in range(len(unknown) + 1)) + ",)"
+    return str(result) + " % " + total + " == 0 and " + str(result) + " <= " + total + " * " + powers + "[" + remaining + "]"
+
+def constraintOrder(puzzle):
+    """
+    Returns the constraints of the Board kenken.buildBoardFromPuzzle
+    builds for a puzzle, in the Board's order, as ("row", y), ("column",
+    x) or ("cage", i) keys
+    """
+    size, constraints = puzzle
+    order = []
+    for i in range(size):
+        order.extend([("row", i), ("column", i)])
+    return order + [("cage", i) for i in range(len(constraints))]
+
+def constraintCells(puzzle, key):
+    """
+    Returns the cell indices (x*size + y) of a constraint, in coordinate order
+    """
+    size, constraints = puzzle
+    kind, i = key
+    if (kind == "row"):
+        return [x*size + i for x in range(size)]
+    elif (kind == "column"):
+        return [i*size + y for y in range(size)]
+    return [x*size + y for x, y in constraints[i][2]]
+
+def generateSource(puzzle):
+    """
+    Returns the source of the checker module for a puzzle, as returned by
+    kenken.parsePuzzle.  The module defines, for every cell k (x*size + y),
+        cell<k>(values)
+            checks every constraint of cell k after it is assigned, given
+            the board's values by cell index (None when unassigned),
+            returning the index (see constraintOrder) of the first broken
+            one, in the order BackTrack.brokenAt checks them, or -1
+    and lists them in cells, with the cells of every constraint in
+    constraintCells to match them to a Board (see boardCheckers).
+    >>> source = generateSource(kenken.parsePuzzle(["2", "div 2 (0,0) (0,1)", "add 3 (1,0) (1,1)"]))
+    >>> print(source[source.index("def cell0"):source.index("def cell1")].strip())
+    def cell0(values):
+        v = values[0]
+        if v == values[2]:
+            return 0
+        if v == values[1]:
+            return 1
+        c1 = values[1]
+        if c1 is not None and not (v == c1 * 2 or c1 == v * 2):
+            return 4
+        return -1
+    """
+    size, constraints = puzzle
+    lines = ["# Checkers generated by codegen.py for puzzle " + puzzleKey(puzzle), ""]
+
+    order = constraintOrder(puzzle)
+    cellConstraints = [[] for cell in range(size*size)]
+    for index in range(len(order)):
+        for cell in constraintCells(puzzle, order[index]):
+            cellConstraints[cell].append(index)
+    for cell in range(size*size):
+        lines.extend(["def cell" + str(cell) + "(values):", "    v = values[" + str(cell) + "]"])
+        for index in cellConstraints[cell]:
+            kind, i = order[index]
+            others = [other for other in constraintCells(puzzle, order[index]) if other != cell]
+            if (kind != "cage"):
+                if (len(others) != 0):
+                    lines.append("    if " + " or ".join("v == values[" + str(other) + "]" for other in others) + ":")
+                    lines.append("        return " + str(index))
+                continue
+            func, result, locations = constraints[i]
+            cageNames = []
+            for other in constraintCells(puzzle, order[index]):
+                cageNames.append("v" if other == cell else "c" + str(other))
+            for other in others:
+                lines.append("    c" + str(other) + " = values[" + str(other) + "]")
+            check = cageCheck(func.__name__, result, cageNames)
+            unknown = ["c" + str(other) for other in others]
+            partial = None
+            if (len(unknown) != 0):
+                partial = partialCheck(func.__name__, result, ["v"], unknown, size)
+            if (len(unknown) == 0):
+                lines.append("    if not (" + check + "):")
+                lines.append("        return " + str(index))
+            elif (partial == None):
+                lines.append("    if " + " and ".join(name + " is not None" for name in unknown) + " and not (" + check + "):")
+                lines.append("        return " + str(index))
+            else:
+                lines.append("    if " + " is None or ".join(unknown) + " is None:")
+                lines.append("        if not (" + partial + "):")
+                lines.append("            return " + str(index))
+                lines.append("    elif not (" + check + "):")
+                lines.append("        return " + str(index))
+        lines.extend(["    return -1", ""])
+
+    lines.append("cells = [" + ", ".join("cell" + str(cell) for cell in range(size*size)) + "]")
+    lines.append("constraintCells = " + repr([constraintCells(puzzle, key) for key in order]))
+    return "\n".join(lines) + "\n"
+
+def loadCheckers(puzzle, codeDirectory=None):
+    """
+    Returns the checker module for a puzzle (see generateSource), loading
+    it from codeDirectory (the current user's directory under the temporary
+    directory by default) when it was generated before, and generating
+    and writing it there otherwise.  The directory and the module must
+    belong to the current user and be writable by nobody else (see
+    checkPrivate), or PermissionError is raised instead of running a
+    module someone else could have put there.
+    """
+    key = puzzleKey(puzzle)
+    if key in loadedCheckers:
+        return loadedCheckers[key]
+    if (codeDirectory == None):
+        codeDirectory = defaultCodeDirectory()
+    privateDirectory(codeDirectory)
+    moduleName = "kkcheck_" + key[:32]
+    path = os.path.join(codeDirectory, moduleName + ".py")
+    if not os.path.exists(path):
+        #Written under another name first, so no process ever loads half a file
+        handle, temporaryPath = tempfile.mkstemp(suffix=".tmp", dir=codeDirectory)
+        with os.fdopen(handle, "w") as codeFile:
+            codeFile.write(generateSource(puzzle))
+        os.replace(temporaryPath, path)
+    checkPrivate(path)
+    spec = importlib.util.spec_from_file_location(moduleName, path)
+    checkers = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(checkers)
+    loadedCheckers[key] = checkers
+    return checkers
+
+def boardCheckers(board, checkers):
+    """
+    Matches a checker module (see loadCheckers) to a Board built from its
+    puzzle (see kenken.buildBoardFromPuzzle).  Returns (cells,
+    constraints): the module's per-cell checkers, and the Board's
+    constraints in the order the cell checkers number them, which is what
+    BackTrack takes as its checkers.  Raises ValueError if the module was
+    generated for a different puzzle.
+    """
+    boardConstraints = board.getConstraints()
+    size = board.getSize()
+    cells = [[coord.getX()*size + coord.getY() for coord in boardConstraint.getCoordinates()]
+             for boardConstraint in boardConstraints]
+    if (cells != checkers.constraintCells):
+        raise ValueError("Error: checkers were generated for a different puzzle")
+    return checkers.cells, list(boardConstraints)
+
+def main(args):
+    if (len(args) != 1):
+        raise ValueError("usage: codegen.py PUZZLE.kk")
+    sys.stdout.write(generateSource(kenken.parsePuzzle(kenken.readLayout(args[0]))))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,3 +1,6 @@
+import itertools
+from coordinate import bitsToValues
+
 
 class Constraint:
     """
@@ -19,6 +22,23 @@ class Constraint:
         within the constraint violate the constraint
         """
 
+    def supportedValues(self, coordinate):
+        """
+        Returns the domain bitmask of values for coordinate that can be
+        extended to a full assignment satisfying the constraint, using the
+        current domains of the other coordinates.
+        This generic version enumerates every combination of the other
+        domains; subclasses override it with something cheaper.
+        """
+        relatedDomains = [coord.getDomain() for coord in self.getCoordinates() if coord != coordinate]
+        supported = 0
+        for value in coordinate.getDomain():
+            for instance in itertools.product(*relatedDomains):
+                if self.valuesSatisfyConstraint((value,) + instance):
+                    supported |= 1 << value
+                    break
+        return supported
+
 class RCConstraint(Constraint):
     """
     Constraints that dictate every row having only one of each number
@@ -31,6 +51,9 @@ class RCConstraint(Constraint):
         is maintaining.
         """
         self.coordinates = coordinates
+        self.lastDomains = None
+        self.lastSupports = None
+        self.lastMatching = None
 
     def getCoordinates(self):
         """
@@ -55,6 +78,19 @@ class RCConstraint(Constraint):
             raise Exception("RCConstraint broken")
         return len(set(values)) == len(values) #True IFF values has no duplicates
 
+    def supportedValues(self, coordinate):
+        """
+        Runs the all-different propagator over the whole row/column and returns
+        the supported values for coordinate.  The supports for every position
+        are kept until the domains change, since the arcConsistency queue
+        usually asks about every coordinate of the row in a row.
+        """
+        domains = tuple(coord.getDomainBits() for coord in self.coordinates)
+        if domains != self.lastDomains:
+            self.lastSupports, self.lastMatching = allDifferentSupports(domains, self.lastMatching)
+            self.lastDomains = domains
+        return self.lastSupports[self.coordinates.index(coordinate)]
+
 class ArithmeticConstraint(Constraint):
     """
     Class representing arithmetic constraints on the kenken board.
@@ -68,11 +104,25 @@ class ArithmeticConstraint(Constraint):
     As well as a result which the operation, applied to the values of the
     coordinates, should evaluate to.
     """
-    def __init__(self, func, result, coordinates):
+    def __init__(self, func, result, coordinates, size):
         self.func = func
         self.coordinates = coordinates
         self.result = result
-        
+        self.size = size
+        self.tuples = None
+        #By function name, since kenken.py run as a script has its own copies of the functions
+        self.operation = func.__name__
+        locations = [(coord.getX(), coord.getY()) for coord in coordinates]
+        #Positions within the cage sharing a row or column with each position
+        self.clashes = [[j for j in range(len(locations)) if j != i and
+                         (locations[i][0] == locations[j][0] or locations[i][1] == locations[j][1])]
+                        for i in range(len(locations))]
+        #The positions grouped by x and by y: each group has to hold distinct values
+        self.lineGroups = [groupPositions([x for x, y in locations]), groupPositions([y for x, y in locations])]
+        #Small add and mul cages are filtered through their tuple table, large
+        #ones by arithmetic alone (see tupleTableLimit)
+        self.useTable = (self.operation not in ("kkAdd", "kkMul")) or size ** len(coordinates) <= tupleTableLimit
+
     def includesCoordinate(self, coordinate):
         return coordinate in self.getCoordinates()
 
@@ -89,3 +139,417 @@ class ArithmeticConstraint(Constraint):
         if len(values) != len(self.coordinates):
             raise Exception("Not enough parameters to check constraint")
         return self.func(*values) == self.result #Return True IFF constraint isn't broken
+
+    def partialValuesFeasible(self, values):
+        """
+        Given the values of the cage's coordinates so far, in coordinate
+        order with None for the unassigned ones, returns False if filling in
+        the rest cannot reach the result: a sum already over the result or
+        unable to reach it, or a product that no longer divides the result.
+        Other operations are only checked once every value is known.
+        """
+        operation = self.operation
+        if (operation != "kkAdd" and operation != "kkMul"):
+            return True
+        assigned = [value for value in values if value != None]
+        remaining = len(values) - len(assigned)
+        if (operation == "kkAdd"):
+            total = sum(assigned)
+            return total + remaining <= self.result <= total + remaining*self.size
+        product = 1
+        for value in assigned:
+            product *= value
+        return self.result % product == 0 and self.result <= product * self.size**remaining
+
+    def getTuples(self):
+        """
+        Returns the table of satisfying assignments for this cage, with every
+        value stored as a single-bit mask (1 << value) in coordinate order.
+        Tables are shared between all cages with the same operation, result,
+        shape and board size, see satisfyingTuples below.
+        """
+        if self.tuples is None:
+            shape = cageShape([(coord.getX(), coord.getY()) for coord in self.coordinates])
+            self.tuples = satisfyingTuples(self.func, self.result, shape, self.size)
+        return self.tuples
+
+    def supportedValues(self, coordinate):
+        """
+        Returns the values for coordinate that can still be part of a
+        satisfying assignment.  Two cell sub and div cages pair values
+        directly, large add and mul cages reason about sums and products
+        (see addSupports and mulSupports, which may keep some values no
+        assignment supports), and every other cage filters its tuple table
+        by the current domains, keeping the values that appear in at least
+        one surviving tuple.
+        """
+        position = self.coordinates.index(coordinate)
+        return self.supportedBits([coord.getDomainBits() for coord in self.coordinates], position)
+
+    def supportedBits(self, domains, position):
+        """
+        Same as supportedValues, for the coordinate at position, with the
+        cage's domains given as bitmasks in coordinate order instead of
+        taken from the Coordinates
+        """
+        if (len(domains) == 2 and (self.operation == "kkSub" or self.operation == "kkDiv")):
+            return pairSupports(self.operation, self.result, domains[position], domains[1 - position],
+                                len(self.clashes[position]) != 0)
+        elif (not self.useTable and self.operation == "kkAdd"):
+            return addSupports(domains, position, self.result, self.clashes[position], self.lineGroups)
+        elif (not self.useTable):
+            return mulSupports(domains, position, self.result, self.clashes[position], self.size)
+        supported = 0
+        for instance in self.getTuples():
+            for i in range(len(instance)):
+                if not (instance[i] & domains[i]):
+                    break
+            else:
+                supported |= instance[position]
+        return supported
+
+
+#Add and mul cages needing more candidate assignments than this (size ** cells)
+#to build their tuple table are propagated arithmetically instead
+tupleTableLimit = 100000
+
+def groupPositions(keys):
+    """
+    Groups positions 0..len(keys)-1 by their key
+    >>> groupPositions([3, 4, 3])
+    [[0, 2], [1]]
+    """
+    groups = {}
+    for position in range(len(keys)):
+        groups.setdefault(keys[position], []).append(position)
+    return [groups[key] for key in sorted(groups)]
+
+def pairSupports(operation, result, domain, otherDomain, clash):
+    """
+    Values of domain that pair up with a value of otherDomain in a two
+    cell sub (kkSub) or div (kkDiv) cage, clash telling whether the two
+    cells share a row or column and so need different values.
+    >>> bin(pairSupports("kkSub", 2, 0b111110, 0b1000, True))
+    '0b100010'
+    >>> bin(pairSupports("kkDiv", 2, 0b1111110, 0b1000, True))
+    '0b1000000'
+    """
+    if (operation == "kkSub"):
+        #Shifting by result pairs value v with v+result and v-result
+        supported = domain & ((otherDomain >> result) | (otherDomain << result))
+    else:
+        supported = 0
+        for value in bitsToValues(domain):
+            if (otherDomain >> (value * result)) & 1 or (value % result == 0 and (otherDomain >> (value // result)) & 1):
+                supported |= 1 << value
+    if (clash and result == (0 if operation == "kkSub" else 1)):
+        #Only equal values give that result
+        supported = 0
+    return supported
+
+def sumBounds(domains, lineGroups):
+    """
+    Returns (low, high) bounds on the sum of one value from each domain
+    (None for a position that is not part of the sum), or None if some
+    domain is empty.  Each of lineGroups is a partition of the positions
+    into groups whose values must all differ, and tightens the bounds:
+    a group can do no better than its smallest (or largest) distinct
+    values.
+    >>> sumBounds([0b0110, 0b0110, 0b1000], [[[0, 1], [2]]])
+    (6, 6)
+    """
+    low = 0
+    high = 0
+    for position in range(len(domains)):
+        if (domains[position] == 0):
+            return None
+        if (domains[position] != None):
+            values = bitsToValues(domains[position])
+            low += values[0]
+            high += values[-1]
+    for groups in lineGroups:
+        groupLow = 0
+        groupHigh = 0
+        for group in groups:
+            members = [position for position in group if domains[position] != None]
+            union = 0
+            for position in members:
+                union |= domains[position]
+            values = bitsToValues(union)
+            if (len(values) < len(members)):
+                return None
+            groupLow += sum(values[:len(members)])
+            groupHigh += sum(values[len(values) - len(members):])
+        low = max(low, groupLow)
+        high = min(high, groupHigh)
+    return low, high
+
+def addSupports(domains, position, result, clashes, lineGroups):
+    """
+    Values for the cell at position of an add cage that leave the other
+    cells a sum within their bounds (see sumBounds), once the value is
+    taken out of the cells sharing a line with position.  Polynomial in
+    the cage size, unlike a tuple table, but it may keep values that
+    only bounds rule out together.
+    >>> bin(addSupports([0b11110, 0b11110, 0b11110], 0, 5, [1, 2], [[[0, 1, 2]]]))
+    '0b0'
+    >>> bin(addSupports([0b11110, 0b11110, 0b11110], 0, 6, [1, 2], [[[0, 1, 2]]]))
+    '0b1110'
+    """
+    supported = 0
+    for value in bitsToValues(domains[position]):
+        others = list(domains)
+        others[position] = None
+        for other in clashes:
+            others[other] &= ~(1 << value)
+        bounds = sumBounds(others, lineGroups)
+        if (bounds != None and bounds[0] <= result - value <= bounds[1]):
+            supported |= 1 << value
+    return supported
+
+#Prime factorizations of small numbers, as {prime: exponent}
+_factorizations = {}
+
+def factorize(number):
+    """
+    Returns the prime factorization of a positive number as {prime: exponent}
+    >>> sorted(factorize(360).items())
+    [(2, 3), (3, 2), (5, 1)]
+    """
+    if number in _factorizations:
+        return _factorizations[number]
+    factors = {}
+    remaining = number
+    prime = 2
+    while prime * prime <= remaining:
+        while remaining % prime == 0:
+            factors[prime] = factors.get(prime, 0) + 1
+            remaining //= prime
+        prime += 1
+    if (remaining > 1):
+        factors[remaining] = factors.get(remaining, 0) + 1
+    if (number <= 4096):
+        _factorizations[number] = factors
+    return factors
+
+def mulSupports(domains, position, result, clashes, size):
+    """
+    Values for the cell at position of a mul cage that divide the result
+    and leave a quotient the other cells can still multiply up to: each
+    of them needs a value dividing the quotient, the quotient has to lie
+    between the products of their smallest and largest such values, and
+    for every prime the exponents the other cells can contribute have to
+    be able to add up to its exponent in the quotient.  Polynomial in the cage size, but it may
+    keep values that only the whole product rules out.
+    >>> bin(mulSupports([0b11110, 0b11110, 0b11110], 0, 18, [], 4))
+    '0b1100'
+    >>> bin(mulSupports([0b1111110, 0b1111110, 0b1111110], 0, 30, [], 6))
+    '0b1101110'
+    """
+    supported = 0
+    for value in bitsToValues(domains[position]):
+        if (result % value != 0):
+            continue
+        quotient = result // value
+        needed = factorize(quotient)
+        if (len(needed) != 0 and max(needed) > size):
+            continue
+        #Per prime, the least and most the other cells can contribute
+        lowest = dict((prime, 0) for prime in needed)
+        highest = dict((prime, 0) for prime in needed)
+        lowProduct = 1
+        highProduct = 1
+        for other in range(len(domains)):
+            if (other == position):
+                continue
+            domain = domains[other]
+            if other in clashes:
+                domain &= ~(1 << value)
+            divisors = [candidate for candidate in bitsToValues(domain) if quotient % candidate == 0]
+            if (len(divisors) == 0):
+                break
+            lowProduct *= divisors[0]
+            highProduct *= divisors[-1]
+            for prime in needed:
+                exponents = [factorize(divisor).get(prime, 0) for divisor in divisors]
+                lowest[prime] += min(exponents)
+                highest[prime] += max(exponents)
+        else:
+            if (lowProduct <= quotient <= highProduct and
+                    all(lowest[prime] <= needed[prime] <= highest[prime] for prime in needed)):
+                supported |= 1 << value
+    return supported
+
+def allDifferentSupports(domains, matching=None):
+    """
+    Given the domain bitmasks of coordinates that must all take different
+    values, returns (supports, matching) where supports[i] is the bitmask of
+    values coordinate i can take in some all-different assignment, and
+    matching[i] is the value coordinate i takes in one such assignment.
+    If no such assignment exists every support is 0 and matching is None.
+
+    This is Regin's matching-based filtering, so it subsumes singleton
+    elimination, hidden singles and Hall sets (naked pairs, triples, ...).
+    A previous matching can be passed in to warm start the search.
+
+    >>> supports, matching = allDifferentSupports((0b0110, 0b0110, 0b1110))
+    >>> [bin(s) for s in supports]
+    ['0b110', '0b110', '0b1000']
+    >>> allDifferentSupports((0b10, 0b10))[0]
+    [0, 0]
+    """
+    count = len(domains)
+    #Value matched to each coordinate, and coordinate owning each value
+    matchOf = [None] * count
+    ownerOf = {}
+    if matching is not None:
+        for i in range(count):
+            value = matching[i]
+            if value is not None and (domains[i] >> value) & 1 and value not in ownerOf:
+                matchOf[i] = value
+                ownerOf[value] = i
+
+    def augment(i, visited):
+        #Kuhn's augmenting path search from coordinate i
+        for value in bitsToValues(domains[i]):
+            if value in visited:
+                continue
+            visited.add(value)
+            owner = ownerOf.get(value)
+            if owner is None or augment(owner, visited):
+                matchOf[i] = value
+                ownerOf[value] = i
+                return True
+        return False
+
+    for i in range(count):
+        if matchOf[i] is None and not augment(i, set()):
+            return [0] * count, None
+
+    #Coordinate i points at coordinate j when i could take j's matched value,
+    #which forces j to move somewhere else
+    edges = []
+    freeValues = 0
+    for i in range(count):
+        freeValues |= domains[i]
+    for i in range(count):
+        freeValues &= ~(1 << matchOf[i])
+    for i in range(count):
+        edges.append([ownerOf[value] for value in bitsToValues(domains[i] & ~freeValues)
+                        if ownerOf[value] != i])
+
+    #A coordinate that reaches one with a free value in its domain can move
+    #without anybody needing its value, so any value it is pushed off is fine
+    canEscape = [bool(domains[i] & freeValues) for i in range(count)]
+    changed = True
+    while changed:
+        changed = False
+        for i in range(count):
+            if not canEscape[i] and any(canEscape[j] for j in edges[i]):
+                canEscape[i] = True
+                changed = True
+
+    #Otherwise i can take j's value only if both sit on an alternating cycle,
+    #i.e. in the same strongly connected component (Tarjan's algorithm)
+    component = [None] * count
+    lowLink = [None] * count
+    order = [None] * count
+    stack = []
+    onStack = [False] * count
+    counter = [0]
+
+    def strongConnect(i):
+        order[i] = lowLink[i] = counter[0]
+        counter[0] += 1
+        stack.append(i)
+        onStack[i] = True
+        for j in edges[i]:
+            if order[j] is None:
+                strongConnect(j)
+                lowLink[i] = min(lowLink[i], lowLink[j])
+            elif onStack[j]:
+                lowLink[i] = min(lowLink[i], order[j])
+        if lowLink[i] == order[i]:
+            while True:
+                j = stack.pop()
+                onStack[j] = False
+                component[j] = i
+                if j == i:
+                    break
+
+    for i in range(count):
+        if order[i] is None:
+            strongConnect(i)
+
+    supports = []
+    for i in range(count):
+        support = (1 << matchOf[i]) | (domains[i] & freeValues)
+        for j in edges[i]:
+            if canEscape[j] or component[i] == component[j]:
+                support |= 1 << matchOf[j]
+        supports.append(support)
+    return supports, matchOf
+
+#Memoized tuple tables, keyed by (operation name, result, cage shape, board size)
+#Kept at module level so they are reused across cages and across puzzles
+_tupleTables = {}
+
+def cageShape(locations):
+    """
+    Translates a cage's (x,y) locations so its top-left corner sits at (0,0),
+    keeping the order of the locations.  Two cages with the same shape have
+    the same pairs of cells sharing a row or column.
+    >>> cageShape([(3,4), (4,4), (4,5)])
+    ((0, 0), (1, 0), (1, 1))
+    """
+    minX = min(x for x, y in locations)
+    minY = min(y for x, y in locations)
+    return tuple((x - minX, y - minY) for x, y in locations)
+
+def satisfyingTuples(func, result, shape, size):
+    """
+    Returns every assignment of values 1..size to a cage of the given shape
+    that makes func evaluate to result, as tuples of single-bit masks.
+    Cells of the cage that share a row or column get distinct values,
+    since the row/column constraints would rule those tuples out anyway.
+    Partial sums and products are used to cut the enumeration short.
+    >>> def kkAdd(*args): return sum(args)
+    >>> [[v.bit_length() - 1 for v in t] for t in satisfyingTuples(kkAdd, 3, ((0,0),(1,0)), 4)]
+    [[1, 2], [2, 1]]
+    """
+    key = (func.__name__, result, shape, size)
+    if key in _tupleTables:
+        return _tupleTables[key]
+    #For each position, the earlier positions it shares a row or column with
+    clashes = [[j for j in range(i) if shape[i][0] == shape[j][0] or shape[i][1] == shape[j][1]]
+                for i in range(len(shape))]
+    isAdd = func.__name__ == "kkAdd"
+    isMul = func.__name__ == "kkMul"
+    tuples = []
+    values = []
+
+    def extend(position, partial):
+        if position == len(shape):
+            if func(*values) == result:
+                tuples.append(tuple(1 << value for value in values))
+            return
+        for value in range(1, size+1):
+            if any(values[j] == value for j in clashes[position]):
+                continue
+            if isAdd:
+                nextPartial = partial + value
+                if nextPartial > result:
+                    break
+            elif isMul:
+                nextPartial = partial * value
+                if result % nextPartial != 0:
+                    continue
+            else:
+                nextPartial = partial
+            values.append(value)
+            extend(position + 1, nextPartial)
+            values.pop()
+
+    extend(0, 0 if isAdd else 1)
+    _tupleTables[key] = tuples
+    return tuples
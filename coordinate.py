@@ -1,5 +1,11 @@
 class Coordinate:
     """
+    A single cell on the KenKen board.
+    The domain is stored as an integer bitmask, where bit v is set
+    IFF the value v is still possible for this coordinate.  This makes
+    membership, removal, size and singleton checks constant time, and
+    backing a domain up is just copying an int.
+
     >>> c = Coordinate(3, 4, [1,2,3,4,5])
     >>> d = Coordinate(3, 4, [1,2,3,4,7])
     >>> c.removeFromDomain(2)
@@ -8,14 +14,21 @@ class Coordinate:
     True
     >>> (c.inDomain(2) or d.inDomain(1))
     False
-    >> (c.getDomain() == [1,3,4,5] and d.getDomain() == [2,3,4,7])
+    >>> (c.getDomain() == [1,3,4,5] and d.getDomain() == [2,3,4,7])
     True
+    >>> c.domainSize()
+    4
+    >>> c.setDomainBits(valuesToBits([3]))
+    >>> (c.isSingleton(), c.singletonValue())
+    (True, 3)
     """
     def __init__(self, x, y, domain):
         self.x = x
         self.y = y
-        self.domain = deepcopy(domain)
-        self.originalDomain = deepcopy(domain)
+        if not isinstance(domain, int):
+            domain = valuesToBits(domain)
+        self.domain = domain
+        self.originalDomain = domain
         self.constraints = []
         self.value = None
 
@@ -24,39 +37,72 @@ class Coordinate:
 
     def getY(self):
         return self.y
-    
+
+    """
+    Returns the number of values left in the domain
+    """
     def domainSize(self):
-        return self.domain
+        return popcount(self.domain)
 
+    """
+    Returns the domain as a sorted list of values.
+    The list is shared between every coordinate with the same domain,
+    so callers must not modify it.
+    """
     def getDomain(self):
-        return self.domain
+        return bitsToValues(self.domain)
 
     def setDomain(self, values):
-        self.domain = values
-    
+        self.domain = valuesToBits(values)
+
+    def getDomainBits(self):
+        return self.domain
+
+    def setDomainBits(self, bits):
+        self.domain = bits
+
     """
     Returns True IFF value is in Coordinate's domain.
     """
     def inDomain(self, value):
-        return value in self.domain
+        return (self.domain >> value) & 1 == 1
 
     """
     Removes value from domain.
     If values isn't in domain, this function does nothing
     """
     def removeFromDomain(self, value):
-        if (value in self.domain):
-            self.domain.remove(value)
+        self.domain &= ~(1 << value)
+
+    """
+    Returns True IFF exactly one value is left in the domain
+    """
+    def isSingleton(self):
+        return self.domain != 0 and (self.domain & (self.domain - 1)) == 0
+
+    """
+    Returns True IFF there are no values left in the domain
+    """
+    def isEmpty(self):
+        return self.domain == 0
+
+    """
+    Returns the smallest value left in the domain, which is the only one
+    when the domain is a singleton.  Returns None for an empty domain.
+    """
+    def singletonValue(self):
+        if self.domain == 0:
+            return None
+        return lowestValue(self.domain)
 
     """
-    When the coordinate was initiated, a deepcopy of the domain
-    was stored in self.originalDomain.
+    When the coordinate was initiated, its domain was stored
+    in self.originalDomain.
     This function restores that domain as the true domain.
-    Of course, the restored domain must also be a deepcopy, in case
-    the domain needs to be restored yet again in the future.
+    Bitmask domains are plain ints, so no copy is needed.
     """
     def resetDomain(self):
-        self.domain = deepcopy(self.originalDomain)
+        self.domain = self.originalDomain
 
     def setValue(self, value):
         self.value = value
@@ -66,7 +112,7 @@ class Coordinate:
 
     def getValue(self):
         return self.value
-    
+
     """
     Returns a list of constraints in which this coordinate is involved in
     """
@@ -80,10 +126,72 @@ class Coordinate:
         self.constraints.append(constraint)
 
 
+####### DOMAIN BITMASK HELPERS ##################
+# A domain is an int where bit v is set IFF the #
+# value v is in the domain.  Bit 0 is never     #
+# used, since KenKen values start at 1.         #
+#################################################
+
+#Memoized bitmask -> sorted value list conversions.
+#Boards never go above a few dozen values, so this stays small.
+_valuesOfBits = {}
+
+def valuesToBits(values):
+    """
+    Builds a domain bitmask from an iterable of values
+    >>> valuesToBits([1, 3])
+    10
+    """
+    bits = 0
+    for value in values:
+        bits |= 1 << value
+    return bits
+
+def bitsToValues(bits):
+    """
+    Returns the sorted list of values in a domain bitmask
+    >>> bitsToValues(10)
+    [1, 3]
+    """
+    try:
+        return _valuesOfBits[bits]
+    except KeyError:
+        values = []
+        value = 0
+        remaining = bits
+        while remaining:
+            if remaining & 1:
+                values.append(value)
+            remaining >>= 1
+            value += 1
+        _valuesOfBits[bits] = values
+        return values
+
+def popcount(bits):
+    """
+    Returns the number of values in a domain bitmask
+    """
+    return bin(bits).count("1")
+
+def lowestValue(bits):
+    """
+    Returns the smallest value in a non-empty domain bitmask
+    """
+    return (bits & -bits).bit_length() - 1
+
+def fullDomainBits(size):
+    """
+    Returns the bitmask of the values 1..size
+    >>> bitsToValues(fullDomainBits(4))
+    [1, 2, 3, 4]
+    """
+    return ((1 << size) - 1) << 1
+
+
 """
-A basic function to make deep copies of lists.  
+A basic function to make deep copies of lists.
 Comes in handy when you want to store away the original
-domains of coordinates, in case you want to restore them 
+domains of coordinates, in case you want to restore them
 at some point in the future.
 
 For an example of where this is used, see arcConsistency(board)
@@ -0,0 +1,157 @@
+#############################################################
+# Binary KenKen puzzle corpora                              #
+#                                                           #
+# Packs many puzzles into one .kkc file so that a large     #
+# collection is one open() and one mmap instead of a text   #
+# file and parse per puzzle.  Layout (little endian):       #
+#   header  "KKCORPUS", version (u32), puzzle count (u64),  #
+#           index offset (u64)                              #
+#   puzzle  size (u8), cage count (u16), then per cage:     #
+#           operation (u8), cell count (u8), target (u32),  #
+#           one u8 per cell holding x*size + y              #
+#   index   one u64 file offset per puzzle                  #
+#                                                           #
+# Usage:                                                    #
+#   python corpus.py OUTPUT.kkc SOURCE...                   #
+# where each SOURCE is anything batch.py accepts            #
+#############################################################
+
+import sys
+import mmap
+import struct
+import kenken
+import batch
+
+MAGIC = b"KKCORPUS"
+VERSION = 1
+header = struct.Struct("<8sIQQ")
+puzzleHeader = struct.Struct("<BH")
+cageHeader = struct.Struct("<BBI")
+indexEntry = struct.Struct("<Q")
+
+#Operation codes in the file, and back
+#(by function name, since kenken.py run as a script has its own copies of the functions)
+operationCodes = dict((kenken.operations[name].__name__, code) for code, name in enumerate(kenken.operationNames))
+operationFuncs = [kenken.operations[name] for name in kenken.operationNames]
+
+#(x, y) for every cell index, one table per board size
+cellLocations = [[divmod(cell, size) for cell in range(size*size)] if size > 0 else [] for size in range(17)]
+
+def encodePuzzle(puzzle):
+    """
+    Packs a puzzle, as returned by kenken.parsePuzzle, into bytes
+    """
+    size, constraints = puzzle
+    if (size > 16):
+        raise ValueError("Error: corpus files hold boards of size 16 at most, not " + str(size))
+    parts = [puzzleHeader.pack(size, len(constraints))]
+    for func, result, locations in constraints:
+        parts.append(cageHeader.pack(operationCodes[func.__name__], len(locations), result))
+        parts.append(bytes(x*size + y for x, y in locations))
+    return b"".join(parts)
+
+def decodePuzzle(buffer, offset):
+    """
+    Unpacks the puzzle stored at offset in buffer, in the same form
+    kenken.parsePuzzle returns
+    >>> puzzle = kenken.parsePuzzle(["2", "div 2 (0,0) (0,1)", "add 3 (1,0) (1,1)"])
+    >>> decodePuzzle(encodePuzzle(puzzle), 0) == puzzle
+    True
+    """
+    size, cageCount = puzzleHeader.unpack_from(buffer, offset)
+    offset += puzzleHeader.size
+    locationOf = cellLocations[size]
+    constraints = []
+    for i in range(cageCount):
+        code, cellCount, result = cageHeader.unpack_from(buffer, offset)
+        offset += cageHeader.size
+        locations = [locationOf[cell] for cell in buffer[offset:offset + cellCount]]
+        offset += cellCount
+        constraints.append((operationFuncs[code], result, locations))
+    return size, constraints
+
+def writeCorpus(fileName, puzzles):
+    """
+    Writes every puzzle (as returned by kenken.parsePuzzle) in the iterable
+    puzzles to a corpus file, one at a time, and returns how many there were
+    """
+    corpusFile = open(fileName, "wb")
+    try:
+        corpusFile.write(header.pack(MAGIC, VERSION, 0, 0))
+        offsets = []
+        for puzzle in puzzles:
+            offsets.append(corpusFile.tell())
+            corpusFile.write(encodePuzzle(puzzle))
+        indexOffset = corpusFile.tell()
+        corpusFile.write(struct.pack("<" + str(len(offsets)) + "Q", *offsets))
+        corpusFile.seek(0)
+        corpusFile.write(header.pack(MAGIC, VERSION, len(offsets), indexOffset))
+    finally:
+        corpusFile.close()
+    return len(offsets)
+
+
+class CorpusReader:
+    """
+    Random access to the puzzles in a corpus file.  The file is memory
+    mapped and each puzzle is only decoded when it is asked for, by index
+    (reader[i]) or by iterating over the reader.
+    """
+    def __init__(self, fileName):
+        self.file = open(fileName, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, indexOffset = header.unpack_from(self.map, 0)
+        if (magic != MAGIC or version != VERSION):
+            self.close()
+            raise ValueError("Error: '" + fileName + "' is not a version " + str(VERSION) + " KenKen corpus")
+        #Offsets are read out of the mapped index one at a time, not copied
+        self.indexOffset = indexOffset
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if (i < 0):
+            i += self.count
+        if not (0 <= i < self.count):
+            raise IndexError("corpus index out of range")
+        return decodePuzzle(self.map, indexEntry.unpack_from(self.map, self.indexOffset + indexEntry.size*i)[0])
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+def isCorpus(fileName):
+    """
+    True if fileName starts like a corpus file
+    """
+    try:
+        corpusFile = open(fileName, "rb")
+    except IOError:
+        return False
+    magic = corpusFile.read(len(MAGIC))
+    corpusFile.close()
+    return magic == MAGIC
+
+def parsedPuzzles(sources):
+    """
+    Yields every puzzle named by sources (see batch.iterPuzzles), parsed
+    """
+    for name, lines in batch.iterPuzzles(sources):
+        if isinstance(lines, tuple):
+            yield lines
+        else:
+            yield kenken.parsePuzzle(lines)
+
+def main(args):
+    if (len(args) < 2):
+        raise ValueError("usage: corpus.py OUTPUT.kkc SOURCE...")
+    count = writeCorpus(args[0], parsedPuzzles(args[1:]))
+    print(str(count) + " puzzles written to " + args[0])
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,247 @@
+#############################################################
+# Random KenKen puzzle generator                            #
+#                                                           #
+# Builds a random Latin square, then covers it with cages   #
+# one at a time.  Every new cage is added to a live         #
+# arcConsistency solver and propagated from the current     #
+# domains, so the board is never re-solved from scratch     #
+# while it is being built.  Once the board is covered, the  #
+# solver looks for a second solution; if there is one, the  #
+# cages back to the first ambiguous cell are undone off the #
+# solver's trail and regrown smaller.                       #
+#                                                           #
+# Usage:                                                    #
+#   python generator.py SIZE COUNT OUTDIR [-s SEED]         #
+#       [-p PROCESSES] [-c MAXCAGESIZE]                     #
+# writes COUNT unique-solution puzzles to OUTDIR as .kk     #
+# files and reports the throughput in puzzles per second.   #
+#############################################################
+
+import sys
+import os
+import random
+import multiprocessing
+from time import perf_counter
+import kenken
+import constraint
+from arcConsistency import arcConsistency
+
+def randomLatinSquare(size, rng):
+    """
+    Returns a random Latin square as a list of columns, square[x][y],
+    filled one column at a time by randomized backtracking.  Restarts
+    from scratch if a fill takes too long.
+    >>> square = randomLatinSquare(5, random.Random(1))
+    >>> all(sorted(column) == [1, 2, 3, 4, 5] for column in square)
+    True
+    >>> all(sorted(square[x][y] for x in range(5)) == [1, 2, 3, 4, 5] for y in range(5))
+    True
+    """
+    while True:
+        square = [[0] * size for i in range(size)]
+        rowUsed = [0] * size
+        columnUsed = [0] * size
+        budget = [size * size * 50]
+
+        def fill(cell):
+            if (cell == size * size):
+                return True
+            budget[0] -= 1
+            if (budget[0] < 0):
+                return False
+            x, y = divmod(cell, size)
+            values = [v for v in range(1, size+1) if not ((rowUsed[y] | columnUsed[x]) >> v) & 1]
+            rng.shuffle(values)
+            for value in values:
+                square[x][y] = value
+                rowUsed[y] |= 1 << value
+                columnUsed[x] |= 1 << value
+                if fill(cell + 1):
+                    return True
+                rowUsed[y] &= ~(1 << value)
+                columnUsed[x] &= ~(1 << value)
+            return False
+
+        if fill(0):
+            return square
+
+def chooseOperation(values, rng):
+    """
+    Picks an operation name and target for a cage holding values
+    """
+    if (len(values) == 1):
+        return "con", values[0]
+    if (len(values) == 2):
+        high, low = max(values), min(values)
+        choices = ["add", "sub", "mul"]
+        if (high % low == 0):
+            choices += ["div", "div"]
+        operation = rng.choice(choices)
+    else:
+        operation = rng.choice(["add", "mul"])
+    if (operation == "div"):
+        return operation, max(values) // min(values)
+    return operation, int(kenken.operations[operation](*values))
+
+
+class PuzzleGenerator:
+    """
+    Generates unique-solution KenKen puzzles of one size.
+    generate() returns (solution, cages) where solution[x][y] is the
+    value at (x,y) and cages is a list of (operation name, target, [(x,y), ...]).
+    """
+    def __init__(self, size, seed=None, maxCageSize=4, maxAttempts=20):
+        self.size = size
+        self.rng = random.Random(seed)
+        self.maxCageSize = maxCageSize
+        self.maxAttempts = maxAttempts
+
+    def generate(self):
+        while True:
+            result = self.tryLatinSquare(randomLatinSquare(self.size, self.rng))
+            if (result != None):
+                return result
+
+    def tryLatinSquare(self, square):
+        """
+        Covers square with cages until its solution is unique, or gives up
+        after maxAttempts rounds and returns None
+        """
+        size = self.size
+        board = kenken.newBoard(size)
+        solver = arcConsistency(board)
+        solver.arcConsistencyHelper()
+        #Per cage: (operation, target, locations, constraint, trail mark before it)
+        cages = []
+        cageOf = {}
+        #Cells found ambiguous in earlier rounds only get small cages
+        tight = set()
+        for attempt in range(self.maxAttempts):
+            while (len(cageOf) != size * size):
+                self.addCage(board, solver, square, cages, cageOf, tight)
+            second = self.findSecondSolution(solver, square)
+            if (second == None):
+                return square, [(operation, target, locations) for operation, target, locations, c, m in cages]
+            ambiguous = [(x, y) for x in range(size) for y in range(size) if second[x][y] != square[x][y]]
+            tight.update(ambiguous)
+            #Undo every cage back to the first one covering an ambiguous cell
+            first = min(cages.index(cageOf[location]) for location in ambiguous)
+            while (len(cages) > first):
+                cage = cages.pop()
+                kenken.detachConstraint(board, cage[3])
+                solver.undoTo(cage[4])
+                for location in cage[2]:
+                    del cageOf[location]
+        return None
+
+    def addCage(self, board, solver, square, cages, cageOf, tight):
+        """
+        Grows one cage from the uncovered cell with the most values left,
+        adds its constraint to the board and propagates it
+        """
+        size = self.size
+        uncovered = [(x, y) for x in range(size) for y in range(size) if (x, y) not in cageOf]
+        widest = max(board.getCoordinate(x, y).domainSize() for x, y in uncovered)
+        start = self.rng.choice([(x, y) for x, y in uncovered if board.getCoordinate(x, y).domainSize() == widest])
+        cageSize = min(self.rng.choice([1, 2, 2, 2, 3, 3, 3, 4, 4]), self.maxCageSize)
+        if (start in tight):
+            cageSize = min(cageSize, 2)
+        locations = [start]
+        while (len(locations) < cageSize):
+            neighbours = []
+            for x, y in locations:
+                for nx, ny in ((x+1, y), (x-1, y), (x, y+1), (x, y-1)):
+                    if (0 <= nx < size and 0 <= ny < size and (nx, ny) not in cageOf
+                            and (nx, ny) not in locations and (nx, ny) not in tight):
+                        neighbours.append((nx, ny))
+            if (len(neighbours) == 0):
+                break
+            locations.append(self.rng.choice(neighbours))
+        operation, target = chooseOperation([square[x][y] for x, y in locations], self.rng)
+        cageConstraint = constraint.ArithmeticConstraint(kenken.operations[operation], target,
+                            [board.getCoordinate(x, y) for x, y in locations], size)
+        cage = (operation, target, locations, cageConstraint, len(solver.trail))
+        kenken.attachConstraint(board, cageConstraint)
+        cages.append(cage)
+        for location in locations:
+            cageOf[location] = cage
+        #Re-propagate from the current domains, only the new cage can prune anything
+        for coord in cageConstraint.getCoordinates():
+            solver.consistencyQueue.append((coord, cageConstraint))
+        solver.arcConsistencyHelper()
+
+    def findSecondSolution(self, solver, square):
+        """
+        Returns a solution other than square, or None if square is the only one.
+        The search starts from the live solver's propagated domains, and
+        leaves them as they were.
+        """
+        solutions = solver.iterSolutions()
+        try:
+            for solution in solutions:
+                if (solution != tuple(tuple(column) for column in square)):
+                    return solution
+            return None
+        finally:
+            solutions.close()
+
+
+def formatPuzzle(size, cages):
+    """
+    Returns the .kk layout text for a puzzle
+    >>> print(formatPuzzle(2, [("div", 2, [(0,0), (0,1)]), ("add", 3, [(1,0), (1,1)])]), end="")
+    2
+    div 2 (0,0) (0,1)
+    add 3 (1,0) (1,1)
+    """
+    lines = [str(size)]
+    for operation, target, locations in cages:
+        lines.append(operation + " " + str(target) + " " +
+                     " ".join("(" + str(x) + "," + str(y) + ")" for x, y in locations))
+    return "\n".join(lines) + "\n"
+
+def generatePuzzle(job):
+    """
+    Runs in a worker process: job is (size, seed, maxCageSize).
+    Returns the .kk text of one unique-solution puzzle.
+    """
+    size, seed, maxCageSize = job
+    solution, cages = PuzzleGenerator(size, seed, maxCageSize).generate()
+    return formatPuzzle(size, cages)
+
+def generatePuzzles(size, count, seed=None, processes=None, maxCageSize=4):
+    """
+    Yields the .kk text of count puzzles, generated on a pool of processes.
+    Puzzle i uses seed + i, so a run is reproducible from its seed.
+    """
+    if (seed == None):
+        seed = random.randrange(1 << 30)
+    jobs = ((size, seed + i, maxCageSize) for i in range(count))
+    pool = multiprocessing.Pool(processes)
+    try:
+        for text in pool.imap(generatePuzzle, jobs):
+            yield text
+    finally:
+        pool.terminate()
+        pool.join()
+
+def main(args):
+    if (len(args) < 3):
+        raise ValueError("usage: generator.py SIZE COUNT OUTDIR [-s SEED] [-p PROCESSES] [-c MAXCAGESIZE]")
+    size, count, outputDir = int(args[0]), int(args[1]), args[2]
+    options = {}
+    for i in range(3, len(args) - 1, 2):
+        options[args[i]] = int(args[i+1])
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+    startTime = perf_counter()
+    puzzles = generatePuzzles(size, count, options.get("-s"), options.get("-p"), options.get("-c", 4))
+    for i, text in enumerate(puzzles):
+        kkFile = open(os.path.join(outputDir, "generated" + str(size) + "x" + str(size) + "_" + str(i) + ".kk"), "w")
+        kkFile.write(text)
+        kkFile.close()
+    seconds = perf_counter() - startTime
+    print(str(count) + " puzzles in " + "%.2f" % seconds + " seconds (" + "%.2f" % (count / seconds) + " puzzles/second)")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -15,8 +15,17 @@ import sys
 import coordinate
 import constraint
 import os
+import portfolio
+import parallel
+import model
+import codegen
+import vectorized
+import backjump
+import restarts
 from arcConsistency import arcConsistency
 from backtrack import BackTrack
+from limits import SearchLimits, LimitReached
+from cache import SolutionCache
 
 def parseConstraint(line):
     """
@@ -138,6 +147,11 @@ def kkCon(*args):
         return None
     return args[0]
 
+#Evaluation functions by the operation names used in KenKen layout files
+operations = {"add": kkAdd, "sub": kkSub, "mul": kkMul, "div": kkDiv, "con": kkCon}
+#Operation names by their integer codes (used by compiled puzzles and corpus files)
+operationNames = ["add", "sub", "mul", "div", "con"]
+
 class Board:
     """
     Class for the Board object
@@ -153,13 +167,13 @@ class Board:
     """
     def __init__(self, size):
         self.size = size
-        startDomain = [i+1 for i in range(size)]
+        #Domains are bitmasks (see coordinate.py), bits 1..size start out set
+        self.fullDomain = coordinate.fullDomainBits(size)
         self.coordinates = []
         for i in range(size):
             for j in range(size):
-                self.coordinates.append(coordinate.Coordinate(i, j, startDomain))
+                self.coordinates.append(coordinate.Coordinate(i, j, self.fullDomain))
         self.constraints = []
-        self.fullDomain = [x+1 for x in range(self.size)]
 
     def getColumn(self, colNum):
         #Return a list of coordinates making up a column
@@ -210,21 +224,42 @@ def generateArithmeticConstraint(board, simpleConstraint):
     coordinates = []
     for x,y in simpleConstraint[2]:
         coordinates.append(board.getCoordinate(x, y))
-    return constraint.ArithmeticConstraint(func, result, coordinates)
+    return constraint.ArithmeticConstraint(func, result, coordinates, board.getSize())
     
 
 
-def main(kenkenFileName, method):
+def buildBoard(kenkenFileName):
     """
-    Make sure supplied info is correct for solving a KenKen file
+    Reads a KenKen layout file and returns a fully configured Board,
+    with its Coordinates, RCConstraints and ArithmeticConstraints
+    """
+    return buildBoardFromLines(readLayout(kenkenFileName))
+
+def readLayout(kenkenFileName):
+    """
+    Returns the lines of a KenKen layout file
     """
     try:
         kkFile = open(kenkenFileName)
     except IOError:
-        raise IOError("Error: could not find KenKen file '" + sys.argv[1] + "'")
-    
+        raise IOError("Error: could not find KenKen file '" + kenkenFileName + "'")
+    kenkenLines = kkFile.readlines()
+    kkFile.close()
+    return kenkenLines
+
+def buildBoardFromLines(kenkenLines):
+    """
+    Same as buildBoard, but takes the lines of a KenKen layout directly
+    """
+    return buildBoardFromPuzzle(parsePuzzle(kenkenLines))
+
+def parsePuzzle(kenkenLines):
+    """
+    Parses the lines of a KenKen layout into (board size, constraints),
+    where constraints is a list of the tuples returned by parseConstraint
+    """
     #Get a list of non-trivial lines from the KenKen config file
-    kenkenLines = [line.strip() for line in kkFile.readlines() if line is not '']
+    kenkenLines = [line.strip() for line in kenkenLines if line.strip() != '']
     
     #The first line should be the size of the board.
     try:
@@ -234,71 +269,216 @@ def main(kenkenFileName, method):
     except ValueError:
         raise ValueError("line: " + kenkenLines[0] + "...Error: first line must be a single int for size")
 
-    #Initialize the board
-    #This will go ahead and also create the Coordinate objects and place them inside the board
-    kenkenBoard = Board(boardSize)
+    #See puzzles/puzzle_layout.txt for how KenKen layout files should look
+    return boardSize, [parseConstraint(line) for line in kenkenLines[1:]]
+
+def buildBoardFromPuzzle(puzzle):
+    """
+    Builds a fully configured Board from the (board size, constraints)
+    tuple returned by parsePuzzle
+    """
+    boardSize, simplifiedConstraints = puzzle
+    #Initialize the board, with its Coordinates and Row/Column constraints
+    kenkenBoard = newBoard(boardSize)
     
-    #Generate the RCConstraints (RC = Row and Column)
+    #Add the ArithmeticConstraints to the board
+    for simplifiedConstraint in simplifiedConstraints:
+        attachConstraint(kenkenBoard, generateArithmeticConstraint(kenkenBoard, simplifiedConstraint))
+    return kenkenBoard
+
+def newBoard(boardSize):
+    """
+    Returns a Board of the given size with its Coordinates and
+    RCConstraints (RC = Row and Column), but no arithmetic constraints yet
+    """
+    kenkenBoard = Board(boardSize)
     for rowColumnConstraint in generateRCConstraints(kenkenBoard):
-        kenkenBoard.addConstraint(rowColumnConstraint)
-        for coord in rowColumnConstraint.getCoordinates():
-            coord.addConstraint(rowColumnConstraint)
-    
-    #Parse the ArithmeticConstraints and add them to the board
-    #See puzzles/puzzle_example.kk for how KenKen layout files should look
-    for line in kenkenLines[1:]:
-        simplifiedConstraint = parseConstraint(line)
-        arithmeticConstraint = generateArithmeticConstraint(kenkenBoard, simplifiedConstraint)
-        kenkenBoard.addConstraint(arithmeticConstraint)
-        for coord in arithmeticConstraint.getCoordinates():
-            coord.addConstraint(arithmeticConstraint)
-    
-    #######
-    # At this point in the main sequence, the kenkenBoard is entirely configured
-    # The Coordinates have been established, and both the Row/Column and Arithmetic
-    # constraints have been created and added to the kenkenBoard
-    # Now it's time to solve the damn thing.
-    # 
-    # For now, only a naive arcConsistency method is implemented.
-    # Future revisions can add some command line arg checking to determine which
-    # method to use to solve the board.
-    #######
-
-    solver = arcConsistency(kenkenBoard)
+        attachConstraint(kenkenBoard, rowColumnConstraint)
+    return kenkenBoard
 
+def attachConstraint(board, constraint):
+    """
+    Adds constraint to the board and to every Coordinate it involves
+    """
+    board.addConstraint(constraint)
+    for coord in constraint.getCoordinates():
+        coord.addConstraint(constraint)
+
+def detachConstraint(board, constraint):
+    """
+    Undoes attachConstraint
+    """
+    board.getConstraints().remove(constraint)
+    for coord in constraint.getCoordinates():
+        coord.getConstraints().remove(constraint)
+
+#Methods that use generated constraint checkers (see codegen.py)
+checkerMethods = ("backTrack", "backTrackCBJ")
+
+def createSolver(kenkenBoard, method, ordering=None, limits=None, observer=None, seed=None, checkers=None):
+    """
+    Returns (solver, solve) for kenkenBoard, where solver is the solver
+    object for the given method (arcCon, arcConLCV, arcConSAC,
+    arcConPresolve, arcConRestarts, arcConCBJ, backTrack, backTrackCBJ or
+    vectorized) and variable ordering (see ordering.py), both default
+    when None, and solve is the function to call on it.  limits is an
+    optional SearchLimits (see limits.py) and observer an optional
+    SolverObserver (see stats.py).  seed seeds arcConRestarts' random
+    choices (see restarts.py).  checkers is an optional module of
+    generated constraint checkers for the board's puzzle (see
+    codegen.loadCheckers); only backTrack and backTrackCBJ use them, any
+    other method raises ValueError when given them.
+    """
+    if (checkers != None):
+        if method not in checkerMethods:
+            raise ValueError("Error: generated checkers are only used by backTrack and backTrackCBJ")
+        checkers = codegen.boardCheckers(kenkenBoard, checkers)
     if (method == None or method == "arcCon"):
-        solver = arcConsistency(kenkenBoard)
-        solveIt = solver.solve
+        solver = arcConsistency(kenkenBoard, ordering, observer, limits)
+        return solver, solver.solve
     elif (method == "arcConLCV"):
-        solver = arcConsistency(kenkenBoard)
-        solveIt = solver.solveWithLCV
+        solver = arcConsistency(kenkenBoard, ordering, observer, limits)
+        return solver, solver.solveWithLCV
+    elif (method == "arcConSAC"):
+        solver = arcConsistency(kenkenBoard, ordering, observer, limits)
+        return solver, solver.solveWithSAC
+    elif (method == "arcConPresolve"):
+        solver = arcConsistency(kenkenBoard, ordering, observer, limits)
+        solver.presolve = True
+        return solver, solver.solve
+    elif (method == "arcConRestarts"):
+        solver = restarts.RestartingSearch(kenkenBoard, ordering, observer, limits, seed)
+        return solver, solver.solve
     elif (method == "backTrack"):
-        solver = BackTrack(kenkenBoard)
-        solveIt = solver.solve
+        solver = BackTrack(kenkenBoard, ordering, observer, limits, checkers=checkers)
+        return solver, solver.solve
+    elif (method == "arcConCBJ"):
+        solver = backjump.BackjumpingSearch(kenkenBoard, ordering, observer, limits)
+        return solver, solver.solve
+    elif (method == "backTrackCBJ"):
+        solver = backjump.BackjumpingBackTrack(kenkenBoard, ordering, observer, limits, checkers=checkers)
+        return solver, solver.solve
+    elif (method == "vectorized"):
+        solver = vectorized.VectorizedSolver(kenkenBoard, ordering, observer, limits)
+        return solver, solver.solve
     else:
-        raise NameError("undefined solving method" + str(method))
+        raise NameError("undefined solving method " + str(method))
+
+def makeSolver(kenkenBoard, method, ordering=None, limits=None):
+    """
+    Returns the function that solves kenkenBoard with the given method
+    (see createSolver) and variable ordering (see ordering.py), both
+    default when None, within the optional SearchLimits (see limits.py).
+    The function returns True IFF a solution was found, in which case it is
+    stored in the Coordinate values, and a falsy LimitReached if a limit
+    stopped it.
+    """
+    return createSolver(kenkenBoard, method, ordering, limits)[1]
 
-    solved = solveIt()
-    if (solved == True):
+def getSolution(kenkenBoard):
+    """
+    Returns the values assigned to the board as a tuple of columns,
+    so that solution[x][y] is the value at (x,y)
+    """
+    size = kenkenBoard.getSize()
+    return tuple(tuple(kenkenBoard.getCoordinate(x, y).getValue() for y in range(size))
+                    for x in range(size))
+
+def printSolution(solution):
+    """
+    Prints a solution, as returned by getSolution, one column at a time
+    """
+    if (solution != None):
         print("Solution Found:")
-        for i in range(kenkenBoard.getSize()):
+        for i in range(len(solution)):
             print("Column " + str(i))
             print("##########")
-            for j in range(kenkenBoard.getSize()):
-                print("(" + str(kenkenBoard.getCoordinate(i, j).getX()) + "," +
-                    str(kenkenBoard.getCoordinate(i,j).getY()) + "): " +
-                     str(kenkenBoard.getCoordinate(i,j).getValue()))
+            for j in range(len(solution)):
+                print("(" + str(i) + "," + str(j) + "): " + str(solution[i][j]))
             print("")
     else:
         print("No solution was found. Perhaps the KenKen file is misconfigured?")
 
+def main(kenkenFileName, method, ordering=None, limits=None, cache=None, codeDirectory=None, seed=None):
+    """
+    Make sure supplied info is correct for solving a KenKen file
+    method picks the solver (arcCon, arcConLCV, arcConSAC, arcConPresolve,
+    arcConRestarts, arcConCBJ, backTrack, backTrackCBJ, vectorized,
+    portfolio or parallel) and ordering picks how it branches (see
+    ordering.py), both default when None, and seed seeds arcConRestarts.
+    limits is an optional SearchLimits (see limits.py).  cache is an optional
+    SolutionCache (see cache.py) that is checked before any Board is built.
+    codeDirectory, if given, is where the puzzle's generated constraint
+    checkers are cached (see codegen.py), for backTrack and backTrackCBJ;
+    without it the generic checks are used.
+    """
+    puzzle = None
+    if (cache != None):
+        puzzle = parsePuzzle(readLayout(kenkenFileName))
+        found, solution, stats = cache.get(puzzle)
+        if found:
+            printSolution(solution)
+            return
+
+    #Portfolio and parallel search keep no stats of their own to cache
+    stats = None
+    if (method == "portfolio"):
+        #Every configuration builds its own board in its own process
+        configuration, solution = portfolio.solvePortfolio(kenkenFileName, limits=limits)
+    elif (method == "parallel"):
+        #Workers split one arcConsistency search tree between them
+        solution = parallel.solveParallel(kenkenFileName, ordering, limits=limits)
+    else:
+        if (puzzle == None):
+            puzzle = parsePuzzle(readLayout(kenkenFileName))
+        result = model.CompiledPuzzle(puzzle).solve(method, ordering, limits, checkers=codeDirectory, seed=seed)
+        if (result.limit != None):
+            print("Search stopped (" + result.status + ") after " + str(result.stats.nodes) + " nodes")
+            return
+        solution = result.solution
+        stats = result.stats.asDict()
+    if isinstance(solution, LimitReached):
+        print("Search stopped (" + solution.reason + ")")
+        return
+    if (cache != None):
+        cache.put(puzzle, solution, stats)
+    printSolution(solution)
+
+
+def parseArguments(args):
+    """
+    Splits command line arguments of the form
+        KENKEN_FILENAME.kk [-m METHOD] [-v ORDERING] [-t TIMEOUT] [-n NODES] [-k CACHEFILE] [-g CODEDIR] [-s SEED]
+    into the filename and a dictionary of flag -> value
+    """
+    if (len(args) == 0 or len(args) % 2 != 1):
+        raise ValueError("usage: kenken.py KENKEN_FILENAME.kk [-m METHOD] [-v ORDERING] [-t TIMEOUT] [-n NODES] [-k CACHEFILE] [-g CODEDIR] [-s SEED]")
+    options = {}
+    for i in range(1, len(args), 2):
+        if args[i] not in ("-m", "-v", "-t", "-n", "-k", "-g", "-s"):
+            raise ValueError("unknown option " + args[i])
+        options[args[i]] = args[i+1]
+    return args[0], options
 
 #Get the ball rolling with the main() function
 if __name__ == "__main__":
-    if (len(sys.argv) == 2):
-        main(sys.argv[1], None)
-    if (len(sys.argv) == 4 and sys.argv[2] == "-m"):
-        main(sys.argv[1], sys.argv[3])
+    kenkenFileName, options = parseArguments(sys.argv[1:])
+    limits = None
+    if ("-t" in options or "-n" in options):
+        timeout = options.get("-t")
+        if (timeout != None):
+            timeout = float(timeout)
+        maxNodes = options.get("-n")
+        if (maxNodes != None):
+            maxNodes = int(maxNodes)
+        limits = SearchLimits(timeout=timeout, maxNodes=maxNodes)
+    solutionCache = None
+    if ("-k" in options):
+        solutionCache = SolutionCache(options["-k"])
+    seed = options.get("-s")
+    if (seed != None):
+        seed = int(seed)
+    main(kenkenFileName, options.get("-m"), options.get("-v"), limits, solutionCache, options.get("-g"), seed)
 
 
 
@@ -0,0 +1,102 @@
+from time import time
+
+class CancellationToken:
+    """
+    Lets another thread (or a signal handler) ask a running solver to stop.
+    The solver notices at its next search node.
+    """
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def isCancelled(self):
+        return self.cancelled
+
+
+class SearchLimits:
+    """
+    Limits a solver checks at every search node:
+        deadline  - wall clock time (as returned by time.time()) to stop at
+        timeout   - seconds from the start of the solve, turned into a deadline
+        maxNodes  - most search nodes to visit
+        token     - a CancellationToken, or anything with isCancelled()
+    Any of them can be None.  One SearchLimits can be shared by several
+    solves, a timeout restarts with each one.
+    """
+    def __init__(self, deadline=None, timeout=None, maxNodes=None, token=None):
+        self.deadline = deadline
+        self.timeout = timeout
+        self.maxNodes = maxNodes
+        self.token = token
+        self.activeDeadline = deadline
+
+    def start(self):
+        """
+        Called by the solver as a solve begins
+        """
+        self.activeDeadline = self.deadline
+        if (self.timeout != None):
+            timeoutDeadline = time() + self.timeout
+            if (self.activeDeadline == None or timeoutDeadline < self.activeDeadline):
+                self.activeDeadline = timeoutDeadline
+
+    def remaining(self):
+        """
+        Seconds left until the deadline of the solve that was started, or
+        None if there is no deadline
+        """
+        if (self.activeDeadline == None):
+            return None
+        return max(0, self.activeDeadline - time())
+
+    def forProcess(self):
+        """
+        Returns the limits of the solve that was started, to hand to a
+        worker process: the timeout becomes the same deadline for every
+        worker, and the token is left out since it cannot be seen from
+        another process
+        """
+        return SearchLimits(deadline=self.activeDeadline, maxNodes=self.maxNodes)
+
+    def check(self, stats):
+        """
+        Raises LimitReached if the solve has to stop now
+        """
+        if (self.token != None and self.token.isCancelled()):
+            raise LimitReached("cancelled")
+        if (self.maxNodes != None and stats.nodes > self.maxNodes):
+            raise LimitReached("node budget exhausted")
+        if (self.activeDeadline != None and time() > self.activeDeadline):
+            raise LimitReached("timed out")
+
+
+class LimitReached(Exception):
+    """
+    What a solve returns instead of True/False when it hit a SearchLimits
+    limit.  It is falsy, so "if solver.solve():" still reads as "solved",
+    and it carries:
+        reason   - "timed out", "node budget exhausted" or "cancelled"
+        stats    - the solver's SolverStats at the time it stopped
+        domains  - {(x,y): list of values} still possible for each
+                   coordinate when the solver stopped
+    """
+    def __init__(self, reason):
+        Exception.__init__(self, reason)
+        self.reason = reason
+        self.stats = None
+        self.domains = None
+
+    def __bool__(self):
+        return False
+
+    def record(self, solver):
+        """
+        Fills in stats and domains from the solver that was stopped
+        """
+        self.stats = solver.stats
+        self.domains = {}
+        for coord in solver.coordinates:
+            self.domains[(coord.getX(), coord.getY())] = list(coord.getDomain())
+        return self
@@ -0,0 +1,168 @@
+import threading
+from time import perf_counter
+import kenken
+import codegen
+from limits import LimitReached
+
+class CompiledPuzzle:
+    """
+    A parsed puzzle that can be solved any number of times, from any
+    number of threads at once.  The puzzle itself is kept in an
+    immutable, flat form, with cells numbered x*size + y, the order
+    Board keeps its Coordinates in:
+        size              - board size
+        cageOps           - operation code of each cage (see kenken.operationNames)
+        cageTargets       - target value of each cage
+        cageCells         - cells of each cage
+    The solvers work on Boards, which they change as they go, so every
+    solve checks a Board out of a pool of idle ones (building one when
+    none is idle), resets it, and hands it back once the result has been
+    copied off it: no two solves ever share a Board, and Boards are only
+    built as often as solves overlap.  The puzzle's generated checkers
+    (see codegen.py) are loaded by the first solve that asks for them and
+    kept for later ones.
+    >>> compiled = CompiledPuzzle(kenken.parsePuzzle(["2", "div 2 (0,0) (0,1)", "add 3 (1,0) (1,1)"]))
+    >>> compiled.cageCells
+    ((0, 1), (2, 3))
+    >>> [compiled.solve(method).solution for method in ("arcCon", "backTrack")]
+    [((1, 2), (2, 1)), ((1, 2), (2, 1))]
+    """
+    __slots__ = ("size", "cageOps", "cageTargets", "cageCells", "idleBoards", "lock", "checkers")
+
+    def __init__(self, puzzle):
+        size, constraints = puzzle
+        #By function name, since kenken.py run as a script has its own copies of the functions
+        codes = dict((kenken.operations[name].__name__, code) for code, name in enumerate(kenken.operationNames))
+        object.__setattr__(self, "size", size)
+        object.__setattr__(self, "cageOps", tuple(codes[func.__name__] for func, result, locations in constraints))
+        object.__setattr__(self, "cageTargets", tuple(result for func, result, locations in constraints))
+        object.__setattr__(self, "cageCells", tuple(tuple(x*size + y for x, y in locations)
+                                                    for func, result, locations in constraints))
+        object.__setattr__(self, "idleBoards", [])
+        #Guards idleBoards and checkers
+        object.__setattr__(self, "lock", threading.Lock())
+        object.__setattr__(self, "checkers", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledPuzzle is immutable")
+
+    def asPuzzle(self):
+        """
+        Returns the puzzle in the (size, constraints) form of kenken.parsePuzzle
+        """
+        size = self.size
+        return size, [(kenken.operations[kenken.operationNames[self.cageOps[cage]]], self.cageTargets[cage],
+                       [divmod(cell, size) for cell in self.cageCells[cage]])
+                      for cage in range(len(self.cageCells))]
+
+    def checkoutBoard(self):
+        """
+        Returns a Board for one solve to work on, with every domain full
+        and every value released, taken from the idle ones if there are
+        any.  Hand it back with checkinBoard once the solve is over.
+        """
+        with self.lock:
+            if (len(self.idleBoards) == 0):
+                board = None
+            else:
+                board = self.idleBoards.pop()
+        if (board == None):
+            return kenken.buildBoardFromPuzzle(self.asPuzzle())
+        for coord in board.getCoordinates():
+            coord.resetDomain()
+            coord.releaseValue()
+        return board
+
+    def checkinBoard(self, board):
+        """
+        Makes a Board from checkoutBoard idle again
+        """
+        with self.lock:
+            self.idleBoards.append(board)
+
+    def loadCheckers(self, codeDirectory):
+        """
+        Returns the puzzle's generated checkers module, loading it from
+        codeDirectory (see codegen.loadCheckers) the first time
+        """
+        with self.lock:
+            if (self.checkers == None):
+                object.__setattr__(self, "checkers", codegen.loadCheckers(self.asPuzzle(), codeDirectory))
+            return self.checkers
+
+    def solve(self, method=None, ordering=None, limits=None, observer=None, checkers=None, seed=None):
+        """
+        Solves the puzzle with the given method (arcCon, arcConLCV,
+        arcConSAC, arcConPresolve, arcConRestarts, backTrack, arcConCBJ,
+        backTrackCBJ or vectorized) and variable ordering (see ordering.py), both default
+        when None, within the optional SearchLimits (see limits.py), and
+        returns a SolveResult.  observer is an optional SolverObserver
+        (see stats.py).  checkers, if given, is the code cache directory to
+        load the puzzle's generated constraint checkers from (see
+        codegen.py), or True for the default one; only backTrack and
+        backTrackCBJ use them, and any other method raises ValueError
+        when asked to.  seed seeds arcConRestarts' random choices (see
+        restarts.py).  Safe to call from several threads at once, as long
+        as they do not share limits or observer.
+        """
+        startTime = perf_counter()
+        module = None
+        if checkers:
+            if method not in kenken.checkerMethods:
+                raise ValueError("Error: generated checkers are only used by backTrack and backTrackCBJ")
+            if (checkers is True):
+                checkers = None
+            module = self.loadCheckers(checkers)
+        board = self.checkoutBoard()
+        try:
+            solver, solveIt = kenken.createSolver(board, method, ordering, limits, observer, seed, module)
+            solved = solveIt()
+            solution = None
+            if (solved == True):
+                solution = kenken.getSolution(board)
+        finally:
+            self.checkinBoard(board)
+        limit = None
+        if isinstance(solved, LimitReached):
+            limit = solved
+        return SolveResult(solution, solver.stats, perf_counter() - startTime, limit)
+
+
+class SolveResult:
+    """
+    What CompiledPuzzle.solve returns
+        status    - "solved", "unsolved", or the reason a limit stopped the search
+        solved    - True IFF a solution was found
+        solution  - the solution as a tuple of columns (solution[x][y] is
+                    the value at (x,y)), or None
+        stats     - the solver's SolverStats (see stats.py)
+        seconds   - wall clock time the solve took
+        limit     - the LimitReached that stopped the search, or None
+    """
+    def __init__(self, solution, stats, seconds, limit=None):
+        self.solution = solution
+        self.solved = solution != None
+        self.stats = stats
+        self.seconds = seconds
+        self.limit = limit
+        if (limit != None):
+            self.status = limit.reason
+        elif self.solved:
+            self.status = "solved"
+        else:
+            self.status = "unsolved"
+
+    def __repr__(self):
+        return "SolveResult(" + repr(self.status) + ", " + repr(self.solution) + ")"
+
+def loadPuzzle(kenkenFileName):
+    """
+    Reads and compiles a KenKen layout file
+    """
+    return CompiledPuzzle(kenken.parsePuzzle(kenken.readLayout(kenkenFileName)))
+
+def compileLines(kenkenLines):
+    """
+    Compiles the lines of a KenKen layout
+    """
+    return CompiledPuzzle(kenken.parsePuzzle(kenkenLines))
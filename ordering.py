@@ -0,0 +1,164 @@
+class VariableOrdering:
+    """
+    Abstract class for picking the next Coordinate to branch on.
+    Solvers call selectCoordinate(solver) at every branching node, where
+    solver provides a list of coordinates in solver.coordinates and an
+    isAssigned(coordinate) method, and call constraintFailed(constraint)
+    every time a constraint wipes out a domain or is found broken.
+    Orderings that rank coordinates break ties in favour of the one listed
+    first, or uniformly at random if random is set to a random.Random.
+    """
+    random = None
+
+    def selectCoordinate(self, solver):
+        """
+        Returns the unassigned Coordinate to branch on next,
+        or None if every coordinate is assigned
+        """
+
+    def constraintFailed(self, constraint):
+        """
+        Notification that constraint caused a failure.  Does nothing by default.
+        """
+
+    def takesTie(self, ties):
+        """
+        Whether a coordinate tied with the best so far, the ties-th such,
+        replaces it, so every tied coordinate is picked with equal chance
+        """
+        return self.random != None and self.random.randrange(ties) == 0
+
+
+class StaticOrdering(VariableOrdering):
+    """
+    Branches on coordinates in the order the solver lists them
+    """
+    def selectCoordinate(self, solver):
+        for coord in solver.coordinates:
+            if not solver.isAssigned(coord):
+                return coord
+        return None
+
+
+class MinimumRemainingValues(VariableOrdering):
+    """
+    Branches on the unassigned coordinate with the fewest values left
+    in its domain (the "fail first" principle).
+    """
+    def selectCoordinate(self, solver):
+        best = None
+        bestSize = None
+        ties = 1
+        for coord in solver.coordinates:
+            if solver.isAssigned(coord):
+                continue
+            size = coord.domainSize()
+            if (best == None or size < bestSize):
+                best = coord
+                bestSize = size
+                ties = 1
+            elif (size == bestSize):
+                ties += 1
+                if self.takesTie(ties):
+                    best = coord
+        return best
+
+
+class MRVDegree(VariableOrdering):
+    """
+    Minimum remaining values, with ties broken by the degree heuristic:
+    the coordinate involved in the most constraints that still have
+    other unassigned coordinates wins.
+    """
+    def selectCoordinate(self, solver):
+        best = None
+        bestKey = None
+        ties = 1
+        for coord in solver.coordinates:
+            if solver.isAssigned(coord):
+                continue
+            key = (coord.domainSize(), -self.degree(solver, coord))
+            if (best == None or key < bestKey):
+                best = coord
+                bestKey = key
+                ties = 1
+            elif (key == bestKey):
+                ties += 1
+                if self.takesTie(ties):
+                    best = coord
+        return best
+
+    def degree(self, solver, coord):
+        degree = 0
+        for constraint in coord.getConstraints():
+            for other in constraint.getCoordinates():
+                if other != coord and not solver.isAssigned(other):
+                    degree += 1
+                    break
+        return degree
+
+
+class DomWDeg(VariableOrdering):
+    """
+    Conflict-directed dom/wdeg ordering (Boussemart et al.).
+    Every constraint starts with weight 1, and its weight goes up by one
+    each time it causes a failure.  The coordinate with the smallest
+    ratio of domain size to the summed weight of its constraints that
+    still have other unassigned coordinates is picked.
+    Weights live on the ordering object, so they carry across the whole
+    search (and across solves, if the same ordering is reused).
+    """
+    def __init__(self):
+        self.weights = {}
+
+    def constraintFailed(self, constraint):
+        self.weights[constraint] = self.weights.get(constraint, 1) + 1
+
+    def weightedDegree(self, solver, coord):
+        weightedDegree = 0
+        for constraint in coord.getConstraints():
+            for other in constraint.getCoordinates():
+                if other != coord and not solver.isAssigned(other):
+                    weightedDegree += self.weights.get(constraint, 1)
+                    break
+        return weightedDegree
+
+    def selectCoordinate(self, solver):
+        best = None
+        bestScore = None
+        ties = 1
+        for coord in solver.coordinates:
+            if solver.isAssigned(coord):
+                continue
+            #Cross multiply rather than divide, a weighted degree of 0 ranks last
+            size = coord.domainSize()
+            weightedDegree = self.weightedDegree(solver, coord)
+            if (best == None or size * bestScore[1] < bestScore[0] * weightedDegree):
+                best = coord
+                bestScore = (size, weightedDegree)
+                ties = 1
+            elif (size * bestScore[1] == bestScore[0] * weightedDegree):
+                ties += 1
+                if self.takesTie(ties):
+                    best = coord
+                    bestScore = (size, weightedDegree)
+        return best
+
+
+#Names accepted on the command line (-v) and by kenken.main
+orderings = {
+    "static": StaticOrdering,
+    "mrv": MinimumRemainingValues,
+    "mrvDeg": MRVDegree,
+    "domWdeg": DomWDeg,
+}
+
+def makeOrdering(name):
+    """
+    Returns a fresh VariableOrdering given its name, defaulting to MRV
+    """
+    if (name == None):
+        name = "mrv"
+    if name not in orderings:
+        raise NameError("undefined variable ordering " + str(name))
+    return orderings[name]()
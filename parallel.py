@@ -0,0 +1,200 @@
+import multiprocessing
+import queue
+import kenken
+from arcConsistency import arcConsistency
+from limits import LimitReached
+
+class Cancelled(Exception):
+    """
+    Raised inside a worker's search once another worker found a solution
+    """
+
+
+class SplittingSearch(arcConsistency):
+    """
+    arcConsistency search that can hand unexplored sibling branches over to
+    other worker processes.  At every node it checks whether some workers
+    sit idle with nothing queued for them, and if so gives away the
+    untried values of its shallowest open branching node (the biggest
+    subtrees it has left), each as its own task.
+
+    A task is the list of domain bitmasks, in solver order, at the node the
+    branch was taken from, with the branching coordinate already set to the
+    donated value.
+
+    limits is an optional SearchLimits (see limits.py); its node budget
+    counts every node this worker visits, over all of its tasks.
+    """
+    def __init__(self, board, ordering, shared, limits=None):
+        arcConsistency.__init__(self, board, ordering, None, limits)
+        self.idle, self.queued, self.outstanding, self.stop, self.tasks = shared
+        self.positions = {}
+        for i in range(len(self.coordinates)):
+            self.positions[self.coordinates[i]] = i
+        #[coordinate, untried values, trail mark] for every node on the current path
+        self.openNodes = []
+
+    def solveFrom(self, domains):
+        """
+        Solves starting from the given domains, or from the board as it
+        was built when domains is None
+        """
+        self.trail = []
+        self.openNodes = []
+        self.depth = 0
+        if (domains != None):
+            for i in range(len(domains)):
+                self.coordinates[i].setDomainBits(domains[i])
+        self.initializeConsistencyQueue()
+        return self.search()
+
+    def search(self):
+        self.stats.nodes += 1
+        self.checkLimits()
+        self.stats.maxDepth = max(self.stats.maxDepth, self.depth)
+        self.checkIn()
+        if (not self.arcConsistencyHelper()):
+            return False
+        elif self.isSolved():
+            return self.recordSolution()
+        mark = len(self.trail)
+        branchCoordinate = self.selectCoordinate()
+        node = [branchCoordinate, list(branchCoordinate.getDomain()), mark]
+        self.openNodes.append(node)
+        try:
+            #Values can disappear from node[1] while we recurse, if they get donated
+            while (len(node[1]) != 0):
+                x = node[1].pop(0)
+                self.branch(branchCoordinate, x)
+                self.depth += 1
+                solved = self.search()
+                self.depth -= 1
+                if (solved):
+                    return True
+                self.stats.backtracks += 1
+                self.undoTo(mark)
+            return False
+        finally:
+            self.openNodes.pop()
+
+    def checkIn(self):
+        if self.stop.is_set():
+            raise Cancelled()
+        if (self.idle.value > self.queued.value):
+            self.donate()
+
+    def donate(self):
+        for node in self.openNodes:
+            if (len(node[1]) != 0):
+                branchCoordinate, values, mark = node
+                domains = self.domainsAt(mark)
+                position = self.positions[branchCoordinate]
+                while (len(values) != 0):
+                    task = list(domains)
+                    task[position] = 1 << values.pop()
+                    with self.outstanding.get_lock():
+                        self.outstanding.value += 1
+                    with self.queued.get_lock():
+                        self.queued.value += 1
+                    self.tasks.put(task)
+                return
+
+    def domainsAt(self, mark):
+        """
+        Returns the domain bitmasks as they were when the trail was at mark,
+        without undoing anything
+        """
+        domains = [coord.getDomainBits() for coord in self.coordinates]
+        for i in range(len(self.trail) - 1, mark - 1, -1):
+            coord, bits = self.trail[i]
+            domains[self.positions[coord]] = bits
+        return domains
+
+
+def searchWorker(kenkenLines, ordering, shared, results, limits=None):
+    """
+    Worker process: builds its own board once, then keeps taking tasks off
+    the shared queue until a solution is found somewhere, or it stops at
+    one of the limits, which it posts as its LimitReached.
+    """
+    idle, queued, outstanding, stop, tasks = shared
+    kenkenBoard = kenken.buildBoardFromLines(kenkenLines)
+    search = SplittingSearch(kenkenBoard, ordering, shared, limits)
+    with idle.get_lock():
+        idle.value += 1
+    while (not stop.is_set()):
+        try:
+            domains = tasks.get(timeout=0.05)
+        except queue.Empty:
+            continue
+        with queued.get_lock():
+            queued.value -= 1
+        with idle.get_lock():
+            idle.value -= 1
+        try:
+            solved = search.solveFrom(domains)
+        except Cancelled:
+            return
+        except LimitReached as limit:
+            results.put(limit)
+            return
+        if solved:
+            results.put(kenken.getSolution(kenkenBoard))
+            return
+        with idle.get_lock():
+            idle.value += 1
+        with outstanding.get_lock():
+            outstanding.value -= 1
+            if (outstanding.value == 0):
+                #Every task has been searched, there is no solution
+                results.put(None)
+
+def solveParallel(kenkenFileName, ordering=None, processes=None, limits=None):
+    """
+    Solves a single KenKen file by splitting the arcConsistency search tree
+    across worker processes (one per CPU by default).  Returns the solution
+    as a tuple of columns, like kenken.getSolution, or None if there is none.
+
+    limits is an optional SearchLimits (see limits.py): each worker
+    searches within its node budget, and all of them within its timeout.
+    Returns a falsy LimitReached if a limit stopped the search.
+    """
+    if (processes == None):
+        processes = multiprocessing.cpu_count()
+    workerLimits = None
+    if (limits != None):
+        limits.start()
+        workerLimits = limits.forProcess()
+    kenkenLines = kenken.readLayout(kenkenFileName)
+    #Parse in the parent too, so a bad file is reported before any worker starts
+    kenken.buildBoardFromLines(kenkenLines)
+
+    shared = (multiprocessing.Value("i", 0), multiprocessing.Value("i", 1),
+              multiprocessing.Value("i", 1), multiprocessing.Event(), multiprocessing.Queue())
+    idle, queued, outstanding, stop, tasks = shared
+    results = multiprocessing.Queue()
+    #The root task starts from the board as parsed
+    tasks.put(None)
+    workers = []
+    for i in range(max(1, processes)):
+        worker = multiprocessing.Process(target=searchWorker, args=(kenkenLines, ordering, shared, results, workerLimits))
+        worker.daemon = True
+        worker.start()
+        workers.append(worker)
+    try:
+        while True:
+            try:
+                return results.get(timeout=0.1)
+            except queue.Empty:
+                if (limits != None and limits.remaining() == 0):
+                    return LimitReached("timed out")
+                #Workers only exit on their own once a result is posted
+                if not any(worker.is_alive() for worker in workers):
+                    raise RuntimeError("parallel search workers exited without a result")
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join(1)
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
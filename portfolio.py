@@ -0,0 +1,122 @@
+import multiprocessing
+import queue
+import kenken
+from limits import LimitReached
+
+#(method, ordering) pairs raced against each other by default.
+#Which one wins varies a lot from puzzle to puzzle.
+defaultConfigurations = [
+    ("arcCon", "mrv"),
+    ("arcCon", "domWdeg"),
+    ("arcCon", "mrvDeg"),
+    ("arcConLCV", "mrv"),
+    ("backTrack", "mrv"),
+]
+
+#Seconds between checks on the workers while waiting for a result
+pollInterval = 0.1
+
+def runConfiguration(kenkenFileName, configuration, results, limits=None):
+    """
+    Runs in a worker process: solves the puzzle with one (method, ordering)
+    configuration within the optional SearchLimits and puts
+    (configuration, outcome, solution) on the results queue.  outcome is
+    "solved", "unsolved", the reason a limit stopped the search, or
+    "error: ..." if the configuration failed; solution is None unless it
+    is "solved".
+    """
+    method, ordering = configuration
+    try:
+        kenkenBoard = kenken.buildBoard(kenkenFileName)
+        solved = kenken.makeSolver(kenkenBoard, method, ordering, limits)()
+    except Exception as error:
+        results.put((configuration, "error: " + repr(error), None))
+        return
+    if isinstance(solved, LimitReached):
+        results.put((configuration, solved.reason, None))
+    elif solved:
+        results.put((configuration, "solved", kenken.getSolution(kenkenBoard)))
+    else:
+        results.put((configuration, "unsolved", None))
+
+def solvePortfolio(kenkenFileName, configurations=None, processes=None, limits=None):
+    """
+    Solves a KenKen file with several solver configurations at once, one
+    process each, and returns (configuration, solution) for the first one
+    to find a solution.  Every other process is terminated at that point.
+    If a configuration finds there is no solution, returns
+    (configuration, None).
+
+    processes caps how many configurations run at the same time, by default
+    one per CPU; the rest start as earlier ones give up without a solution.
+
+    limits is an optional SearchLimits (see limits.py): every configuration
+    searches within its node budget, and all of them within its timeout.
+    If the timeout runs out, or every configuration stops at a limit,
+    returns (None, LimitReached).  Raises RuntimeError with the errors if
+    every configuration fails; a worker process that dies without posting
+    its outcome (killed, or out of memory) counts as failed.
+    """
+    if (configurations == None):
+        configurations = defaultConfigurations
+    if (processes == None):
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(configurations)))
+    workerLimits = None
+    if (limits != None):
+        limits.start()
+        workerLimits = limits.forProcess()
+
+    results = multiprocessing.Queue()
+    pending = list(configurations)
+    running = []
+
+    def startNext():
+        configuration = pending.pop(0)
+        worker = multiprocessing.Process(target=runConfiguration,
+                                         args=(kenkenFileName, configuration, results, workerLimits))
+        worker.daemon = True
+        worker.start()
+        running.append((worker, configuration))
+
+    try:
+        while (len(pending) != 0 and len(running) < processes):
+            startNext()
+        stopped = None
+        errors = []
+        finished = []
+        while (len(finished) < len(configurations)):
+            wait = pollInterval
+            if (limits != None and limits.remaining() != None):
+                wait = min(wait, limits.remaining())
+            try:
+                posted = [results.get(timeout=wait)]
+            except queue.Empty:
+                if (limits != None and limits.remaining() == 0):
+                    return None, LimitReached("timed out")
+                #A worker that was killed or crashed before posting never will
+                posted = [(configuration, "error: worker died (exit code " + str(worker.exitcode) + ")", None)
+                          for worker, configuration in running
+                          if configuration not in finished and worker.exitcode not in (None, 0)]
+            for configuration, outcome, solution in posted:
+                if configuration in finished:
+                    continue
+                finished.append(configuration)
+                if (outcome == "solved" or outcome == "unsolved"):
+                    return configuration, solution
+                elif outcome.startswith("error: "):
+                    errors.append(str(configuration) + " " + outcome)
+                else:
+                    stopped = LimitReached(outcome)
+                if (len(pending) != 0):
+                    startNext()
+        if (stopped != None):
+            return None, stopped
+        raise RuntimeError("every portfolio configuration failed:\n" + "\n".join(errors))
+    finally:
+        for worker, configuration in running:
+            if worker.is_alive():
+                worker.terminate()
+        for worker, configuration in running:
+            worker.join()
+        results.close()
@@ -0,0 +1,231 @@
+from coordinate import bitsToValues, popcount
+from constraint import RCConstraint, ArithmeticConstraint, addSupports, groupPositions
+
+class Presolver:
+    """
+    KenKen deductions made the way a person would, run on an
+    arcConsistency solver's domains before it starts branching.  Every
+    rule only removes values that no solution uses:
+        singleCellCage    - a one cell cage fixes its cell's value
+        nakedSingle       - a cell's only value leaves the rest of its line
+        hiddenSingle      - a value with one place left in a line goes there
+        nakedPair         - two cells of a line left with the same two values
+                            take those values away from the rest of the line
+        hiddenPair        - two values with the same two places left in a line
+                            take those two cells
+        cageIntersection  - a value every remaining combination of a cage
+                            uses, which only fits cells of the cage in one
+                            line, leaves the rest of that line
+        innieOutie        - a line adds up to n(n+1)/2, so the cells left once
+                            the cages inside it with known sums are taken out
+                            (innies), and the cells sticking out of the cages
+                            covering it if all their sums are known (outies),
+                            have a known sum too and are treated as an add cage
+    (a line is a row or a column).  run() applies the rules in turn until
+    none of them removes anything; solver.stats.rulesFired counts the
+    values each rule removed.
+    """
+    def __init__(self, solver):
+        self.solver = solver
+        board = solver.board
+        self.size = board.getSize()
+        self.lines = [lineConstraint.getCoordinates() for lineConstraint in board.getConstraints()
+                      if isinstance(lineConstraint, RCConstraint)]
+        self.cages = [cage for cage in board.getConstraints() if isinstance(cage, ArithmeticConstraint)]
+        self.failed = False
+
+    def narrow(self, rule, coord, bits):
+        """
+        Cuts coord's domain down to bits on behalf of rule.
+        Returns True if that removed anything.
+        """
+        domain = coord.getDomainBits()
+        bits &= domain
+        if (bits == domain):
+            return False
+        solver = self.solver
+        solver.setDomainBits(coord, bits)
+        solver.addRelatedToQueue(coord)
+        removed = popcount(domain & ~bits)
+        solver.stats.valuesPruned += removed
+        solver.stats.rulesFired[rule] = solver.stats.rulesFired.get(rule, 0) + removed
+        if (bits == 0):
+            self.failed = True
+        return True
+
+    def run(self):
+        """
+        Applies the rules until none of them changes anything.
+        Returns False if one wiped out a domain, so the puzzle has no solution.
+        """
+        rules = [self.singleCellCages, self.nakedSingles, self.hiddenSingles, self.nakedPairs,
+                 self.hiddenPairs, self.cageIntersections, self.innieOutie]
+        changed = True
+        while changed:
+            changed = False
+            for rule in rules:
+                if rule():
+                    changed = True
+                if self.failed:
+                    return False
+        return True
+
+    def singleCellCages(self):
+        changed = False
+        for cage in self.cages:
+            cells = cage.getCoordinates()
+            if (len(cells) == 1):
+                changed |= self.narrow("singleCellCage", cells[0], cage.supportedValues(cells[0]))
+        return changed
+
+    def nakedSingles(self):
+        changed = False
+        for line in self.lines:
+            for coord in line:
+                bits = coord.getDomainBits()
+                if (bits != 0 and bits & (bits - 1) == 0):
+                    for other in line:
+                        if (other is not coord):
+                            changed |= self.narrow("nakedSingle", other, ~bits)
+        return changed
+
+    def hiddenSingles(self):
+        changed = False
+        for line in self.lines:
+            for value in range(1, self.size + 1):
+                places = [coord for coord in line if (coord.getDomainBits() >> value) & 1]
+                if (len(places) == 0):
+                    self.failed = True
+                    return changed
+                if (len(places) == 1):
+                    changed |= self.narrow("hiddenSingle", places[0], 1 << value)
+        return changed
+
+    def nakedPairs(self):
+        changed = False
+        for line in self.lines:
+            pairs = {}
+            for coord in line:
+                if (popcount(coord.getDomainBits()) == 2):
+                    pairs.setdefault(coord.getDomainBits(), []).append(coord)
+            for bits, coords in pairs.items():
+                if (len(coords) == 2):
+                    for other in line:
+                        if other not in coords:
+                            changed |= self.narrow("nakedPair", other, ~bits)
+        return changed
+
+    def hiddenPairs(self):
+        changed = False
+        for line in self.lines:
+            #For each value, the positions in the line it can still go, as a bitmask
+            places = {}
+            for value in range(1, self.size + 1):
+                mask = 0
+                for i in range(len(line)):
+                    if (line[i].getDomainBits() >> value) & 1:
+                        mask |= 1 << i
+                if (popcount(mask) == 2):
+                    places.setdefault(mask, []).append(value)
+            for mask, values in places.items():
+                if (len(values) == 2):
+                    for i in bitsToValues(mask):
+                        changed |= self.narrow("hiddenPair", line[i], (1 << values[0]) | (1 << values[1]))
+        return changed
+
+    def cageIntersections(self):
+        changed = False
+        for cage in self.cages:
+            if not cage.useTable:
+                continue
+            cells = cage.getCoordinates()
+            domains = [coord.getDomainBits() for coord in cells]
+            #Values in every combination the domains still allow
+            required = None
+            for instance in cage.getTuples():
+                for i in range(len(instance)):
+                    if not (instance[i] & domains[i]):
+                        break
+                else:
+                    used = 0
+                    for bit in instance:
+                        used |= bit
+                    required = used if required == None else required & used
+            if (required == None):
+                self.failed = True
+                return changed
+            for value in bitsToValues(required):
+                places = [coord for coord in cells if (coord.getDomainBits() >> value) & 1]
+                for line in self.linesThrough(places):
+                    for other in line:
+                        if other not in cells:
+                            changed |= self.narrow("cageIntersection", other, ~(1 << value))
+        return changed
+
+    def linesThrough(self, coords):
+        """
+        Returns the lines holding every one of coords (none if they are
+        spread over several rows and columns)
+        """
+        if (len(coords) == 0):
+            return []
+        return [line for line in self.lines if all(coord in line for coord in coords)]
+
+    def knownSum(self, cage):
+        """
+        The sum of a cage's values if it is already known, or None
+        """
+        cells = cage.getCoordinates()
+        if (cage.operation == "kkAdd" or (cage.operation == "kkCon" and len(cells) == 1)):
+            return cage.result
+        values = []
+        for coord in cells:
+            bits = coord.getDomainBits()
+            if (bits == 0 or bits & (bits - 1) != 0):
+                return None
+            values.append(bits.bit_length() - 1)
+        return sum(values)
+
+    def innieOutie(self):
+        changed = False
+        lineSum = self.size * (self.size + 1) // 2
+        for line in self.lines:
+            inLine = set(line)
+            crossing = [cage for cage in self.cages if any(coord in inLine for coord in cage.getCoordinates())]
+            sums = [self.knownSum(cage) for cage in crossing]
+            #Innies: the cells not in a cage inside the line with a known sum
+            innies = list(line)
+            remaining = lineSum
+            for cage, cageSum in zip(crossing, sums):
+                if (cageSum != None and all(coord in inLine for coord in cage.getCoordinates())):
+                    remaining -= cageSum
+                    innies = [coord for coord in innies if coord not in cage.getCoordinates()]
+            if (len(innies) < len(line)):
+                changed |= self.virtualCage(innies, remaining)
+            #Outies: the cells sticking out of the cages covering the line
+            covered = set(coord for cage in crossing for coord in cage.getCoordinates())
+            if (None not in sums and inLine <= covered):
+                outies = [coord for cage in crossing for coord in cage.getCoordinates() if coord not in inLine]
+                changed |= self.virtualCage(outies, sum(sums) - lineSum)
+            if self.failed:
+                return changed
+        return changed
+
+    def virtualCage(self, coords, total):
+        """
+        Narrows coords as if they made up an add cage with result total
+        """
+        if (len(coords) == 0):
+            if (total != 0):
+                self.failed = True
+            return False
+        locations = [(coord.getX(), coord.getY()) for coord in coords]
+        clashes = [[j for j in range(len(coords)) if j != i and
+                    (locations[i][0] == locations[j][0] or locations[i][1] == locations[j][1])]
+                   for i in range(len(coords))]
+        lineGroups = [groupPositions([x for x, y in locations]), groupPositions([y for x, y in locations])]
+        domains = [coord.getDomainBits() for coord in coords]
+        changed = False
+        for i in range(len(coords)):
+            changed |= self.narrow("innieOutie", coords[i], addSupports(domains, i, total, clashes[i], lineGroups))
+        return changed
@@ -0,0 +1,184 @@
+import random
+from arcConsistency import arcConsistency
+from backjump import NogoodStore
+
+class Restart(Exception):
+    """
+    Raised inside a run's search once it has used up its failure budget
+    """
+
+
+def luby(i):
+    """
+    Returns the i-th term (counting from 0) of the Luby sequence
+    1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ...
+    >>> [luby(i) for i in range(15)]
+    [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8]
+    """
+    size = 1
+    power = 1
+    #Find the shortest prefix 2^k - 1 terms long that holds term i
+    while (size < i + 1):
+        size = 2*size + 1
+        power *= 2
+    while (size - 1 != i):
+        size //= 2
+        power //= 2
+        i %= size
+    return power
+
+
+class LubySchedule:
+    """
+    Run i may fail unit * luby(i) times before it is restarted.  Within a
+    logarithmic factor of the best fixed cutoff on any puzzle, without
+    knowing that cutoff (Luby, Sinclair and Zuckerman).
+    """
+    def __init__(self, unit=128):
+        self.unit = unit
+
+    def cutoff(self, run):
+        return self.unit * luby(run)
+
+
+class GeometricSchedule:
+    """
+    Run i may fail first * factor**i times before it is restarted
+    """
+    def __init__(self, first=64, factor=1.5):
+        self.first = first
+        self.factor = factor
+
+    def cutoff(self, run):
+        return int(self.first * self.factor ** run)
+
+
+#Names accepted by RestartingSearch
+schedules = {
+    "luby": LubySchedule,
+    "geometric": GeometricSchedule,
+}
+
+
+class RestartingSearch(arcConsistency):
+    """
+    arcConsistency search that restarts from the root whenever a run has
+    failed as many times as the restart schedule (LubySchedule by default)
+    allows, every run getting a bigger budget in the end so the search
+    stays complete.  Ties in variable selection are broken at random and
+    values are tried in random order, so every run explores a different
+    part of the tree, which cuts off the long runs a bad early choice
+    causes.  All the randomness comes from one random.Random seeded with
+    seed, so a run is reproduced exactly by its seed.
+
+    What a run learned carries over to the next: the ordering (by default
+    domWdeg) is kept, so its constraint weights steer later runs, and a
+    restarted run leaves nogoods behind (see NogoodStore): every value a
+    level of the branch being abandoned had already searched through,
+    together with the decisions above it, so later runs skip those
+    subtrees instead of searching them again (Lecoutre et al.'s nogoods
+    from restarts).
+    """
+    def __init__(self, board, ordering=None, observer=None, limits=None, seed=None, schedule=None, nogoods=None):
+        if (ordering == None):
+            ordering = "domWdeg"
+        arcConsistency.__init__(self, board, ordering, observer, limits)
+        if (seed == None):
+            seed = 0
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.ordering.random = self.random
+        if (schedule == None):
+            schedule = "luby"
+        if isinstance(schedule, str):
+            if schedule not in schedules:
+                raise NameError("undefined restart schedule " + schedule)
+            schedule = schedules[schedule]()
+        self.schedule = schedule
+        if (nogoods == None):
+            nogoods = NogoodStore()
+        self.nogoods = nogoods
+        #stats.backtracks at which the current run gets restarted
+        self.cutoff = None
+        #(coordinate, value) decided at each level of the current branch
+        self.decisions = []
+
+    def solve(self):
+        """
+        Same as arcConsistency.solve, with restarts
+        """
+        return self.runSearch(self.searchWithRestarts)
+
+    def searchWithRestarts(self):
+        if (not self.arcConsistencyHelper()):
+            return False
+        rootMark = len(self.trail)
+        run = 0
+        while True:
+            self.cutoff = self.stats.backtracks + self.schedule.cutoff(run)
+            try:
+                return self.restartingSearch()
+            except Restart:
+                self.undoTo(rootMark)
+                self.depth = 0
+                self.decisions = []
+                self.stats.restarts += 1
+                run += 1
+            finally:
+                self.cutoff = None
+
+    def restartingSearch(self):
+        """
+        The recursive part of solve: arcConsistency.search, skipping values
+        that match a nogood, and learning nogoods as a Restart goes by
+        """
+        stats = self.stats
+        stats.nodes += 1
+        self.checkLimits()
+        stats.maxDepth = max(stats.maxDepth, self.depth)
+        if (not self.arcConsistencyHelper()):
+            return False
+        elif self.isSolved():
+            return self.recordSolution()
+        mark = len(self.trail)
+        branchCoordinate = self.selectCoordinate()
+        #Values whose subtrees were searched through without a solution
+        refuted = []
+        for x in self.valueOrder(branchCoordinate):
+            if (self.nogoods.match(branchCoordinate, x, self.holds) != None):
+                stats.nogoodPrunes += 1
+                continue
+            self.decisions.append((branchCoordinate, x))
+            self.branch(branchCoordinate, x)
+            self.depth += 1
+            try:
+                solved = self.restartingSearch()
+            except Restart:
+                self.decisions.pop()
+                for value in refuted:
+                    self.nogoods.add(self.decisions + [(branchCoordinate, value)])
+                raise
+            self.depth -= 1
+            self.decisions.pop()
+            if (solved):
+                return True
+            stats.backtracks += 1
+            refuted.append(x)
+            self.undoTo(mark)
+        return False
+
+    def holds(self, coord, value):
+        return coord.getDomainBits() == 1 << value
+
+    def checkLimits(self):
+        arcConsistency.checkLimits(self)
+        if (self.cutoff != None and self.stats.backtracks >= self.cutoff):
+            raise Restart()
+
+    def valueOrder(self, coord):
+        """
+        Returns the values of coord in a random order
+        """
+        values = list(coord.getDomain())
+        self.random.shuffle(values)
+        return values
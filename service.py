@@ -0,0 +1,440 @@
+#############################################################
+# KenKen solving service                                    #
+#                                                           #
+# A long running asyncio server handing puzzles to a pool   #
+# of warm worker processes (already started, with the       #
+# solver imported), so requests skip the interpreter start  #
+# and imports of running kenken.py each time.               #
+#                                                           #
+# HTTP:                                                     #
+#   POST /solve     body is a .kk layout (any content type  #
+#                   but application/json) or a JSON request #
+#   GET  /metrics   queue depth, latency and throughput     #
+# Line protocol (-u): one JSON request per line on a Unix   #
+# socket, answered by one JSON line; {"metrics": true}      #
+# asks for the metrics.                                     #
+#                                                           #
+# A JSON request holds the puzzle as "puzzle" (.kk text or  #
+# a list of its lines) or as "size" and "cages" (lists of   #
+# [operation, target, [[x, y], ...]]), and optionally       #
+# "id", "method", "ordering", "timeout" (seconds, queueing  #
+# included) and "nodes".  Over HTTP, method, ordering,      #
+# timeout and nodes can be query parameters too.  Answers   #
+# are batch.py's result objects (see batch.py) plus "id",   #
+# "queueSeconds" and "latency".  Requests are queued up to  #
+# -q deep: past that HTTP answers 503 with status "busy",   #
+# while a socket connection stops being read until there is #
+# room again.                                               #
+#                                                           #
+# Usage:                                                    #
+#   python service.py [-H HOST] [-P PORT] [-u SOCKETPATH]   #
+#       [-p PROCESSES] [-q QUEUESIZE] [-m METHOD]           #
+#       [-v ORDERING] [-t TIMEOUT] [-n NODES]               #
+#       [-k CACHEFILE]                                      #
+#############################################################
+
+import sys
+import json
+import asyncio
+import signal
+import multiprocessing
+import concurrent.futures
+from collections import deque
+from time import time, perf_counter
+from urllib.parse import urlsplit, parse_qs
+import model
+import batch
+from limits import SearchLimits
+from stats import percentile
+
+#Largest HTTP request body accepted, in bytes
+maxBodySize = 1 << 20
+
+#Completed requests the latency percentiles are taken over
+latencyWindow = 1000
+
+#Seconds the throughput is averaged over
+throughputWindow = 60.0
+
+def warmWorker():
+    """
+    Runs once in every worker process as it starts, solving a small
+    puzzle so the solver's code paths and memoized tables are ready
+    before the first request
+    """
+    model.compileLines(["2", "div 2 (0,0) (0,1)", "add 3 (1,0) (1,1)"]).solve()
+
+def workerReady():
+    return True
+
+def puzzleLines(request):
+    """
+    Returns the .kk layout lines of a JSON request's puzzle
+    >>> puzzleLines({"size": 2, "cages": [["div", 2, [[0, 0], [0, 1]]], ["add", 3, [[1, 0], [1, 1]]]]})
+    ['2', 'div 2 (0,0) (0,1)', 'add 3 (1,0) (1,1)']
+    >>> puzzleLines({"puzzle": "2\\ndiv 2 (0,0) (0,1)\\n"})
+    ['2', 'div 2 (0,0) (0,1)']
+    """
+    if ("puzzle" in request):
+        puzzle = request["puzzle"]
+        if isinstance(puzzle, str):
+            puzzle = puzzle.splitlines()
+        if not (isinstance(puzzle, list) and all(isinstance(line, str) for line in puzzle)):
+            raise ValueError("puzzle must be .kk text or a list of its lines")
+        return [line for line in puzzle if line.strip() != '']
+    if ("size" in request and "cages" in request):
+        lines = [str(int(request["size"]))]
+        for operation, target, locations in request["cages"]:
+            lines.append(" ".join([str(operation), str(target)] +
+                                  ["(" + str(int(x)) + "," + str(int(y)) + ")" for x, y in locations]))
+        return lines
+    raise ValueError("request needs a puzzle, or a size and cages")
+
+
+class ServiceMetrics:
+    """
+    Counters and recent timings of a SolvingService:
+        received      - requests accepted into the queue
+        rejected      - requests turned away because the queue was full
+        completed     - requests answered, by status
+        latencies     - seconds from arrival to answer of the last
+                        latencyWindow requests
+        queueWaits    - seconds those requests spent queued
+        finishTimes   - when requests finished during the last
+                        throughputWindow seconds
+    """
+    def __init__(self):
+        self.startTime = perf_counter()
+        self.received = 0
+        self.rejected = 0
+        self.completed = {}
+        self.latencies = deque(maxlen=latencyWindow)
+        self.queueWaits = deque(maxlen=latencyWindow)
+        self.finishTimes = deque()
+
+    def finished(self, status, latency, queueWait):
+        self.completed[status] = self.completed.get(status, 0) + 1
+        self.latencies.append(latency)
+        self.queueWaits.append(queueWait)
+        now = perf_counter()
+        self.finishTimes.append(now)
+        while (self.finishTimes[0] < now - throughputWindow):
+            self.finishTimes.popleft()
+
+    def asDict(self, queueDepth, queueSize, inFlight, workers):
+        now = perf_counter()
+        while (len(self.finishTimes) != 0 and self.finishTimes[0] < now - throughputWindow):
+            self.finishTimes.popleft()
+        uptime = now - self.startTime
+        latencies = sorted(self.latencies)
+        return {"queueDepth": queueDepth,
+                "queueSize": queueSize,
+                "inFlight": inFlight,
+                "workers": workers,
+                "received": self.received,
+                "rejected": self.rejected,
+                "completed": dict(self.completed),
+                "latency": {"p50": percentile(latencies, 0.5),
+                            "p95": percentile(latencies, 0.95),
+                            "p99": percentile(latencies, 0.99),
+                            "max": latencies[-1] if latencies else None,
+                            "meanQueueWait": sum(self.queueWaits) / len(self.queueWaits) if self.queueWaits else None},
+                "throughput": len(self.finishTimes) / min(uptime, throughputWindow) if uptime > 0 else 0.0,
+                "uptime": uptime}
+
+
+class SolvingService:
+    """
+    Queues solve requests and runs them on a pool of worker processes.
+    At most queueSize requests wait in the queue, and one dispatcher task
+    per worker takes them out and solves them with batch.solvePuzzle, so
+    the queue only holds requests no worker is free for.  method,
+    ordering, timeout, maxNodes and cachePath are the defaults for
+    requests that do not give their own, timeout also capping the
+    timeouts they do give.  A request's deadline counts from its arrival,
+    so time spent queued is part of it; one whose deadline passed while
+    queued is answered "timed out" without being solved.
+    """
+    def __init__(self, processes=None, queueSize=64, method=None, ordering=None,
+                 timeout=None, maxNodes=None, cachePath=None):
+        if (processes == None):
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+        self.queueSize = queueSize
+        self.method = method
+        self.ordering = ordering
+        self.timeout = timeout
+        self.maxNodes = maxNodes
+        self.cachePath = cachePath
+        self.metrics = ServiceMetrics()
+        self.inFlight = 0
+        self.queue = None
+        self.pool = None
+        self.dispatchers = []
+
+    async def start(self):
+        """
+        Starts the worker processes, waits until every one of them is warm,
+        and starts the dispatchers
+        """
+        self.queue = asyncio.Queue(self.queueSize)
+        self.pool = concurrent.futures.ProcessPoolExecutor(self.processes, initializer=warmWorker)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, workerReady) for i in range(self.processes)])
+        self.dispatchers = [asyncio.ensure_future(self.dispatch()) for i in range(self.processes)]
+
+    async def stop(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        self.dispatchers = []
+        self.pool.shutdown(cancel_futures=True)
+
+    def getMetrics(self):
+        return self.metrics.asDict(self.queue.qsize(), self.queueSize, self.inFlight, self.processes)
+
+    async def submit(self, request, wait=False):
+        """
+        Queues a JSON request (see the top of this file) and returns its
+        answer.  When the queue is full, waits for room if wait is True and
+        answers "busy" at once otherwise.
+        """
+        arrival = perf_counter()
+        answer = asyncio.get_running_loop().create_future()
+        item = (request, arrival, answer)
+        if wait:
+            await self.queue.put(item)
+        else:
+            try:
+                self.queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self.metrics.rejected += 1
+                return {"id": request.get("id"), "status": "busy", "solution": None,
+                        "error": "queue full (" + str(self.queueSize) + " requests waiting)"}
+        self.metrics.received += 1
+        return await answer
+
+    def requestLimits(self, request, remaining):
+        """
+        Returns the SearchLimits for a request with remaining seconds left
+        before its deadline (None if it has none)
+        """
+        maxNodes = request.get("nodes", self.maxNodes)
+        if (maxNodes != None):
+            maxNodes = int(maxNodes)
+        if (remaining == None and maxNodes == None):
+            return None
+        deadline = None
+        if (remaining != None):
+            deadline = time() + remaining
+        return SearchLimits(deadline=deadline, maxNodes=maxNodes)
+
+    def requestTimeout(self, request):
+        timeout = request.get("timeout")
+        if (timeout == None):
+            return self.timeout
+        timeout = float(timeout)
+        if (self.timeout != None):
+            timeout = min(timeout, self.timeout)
+        return timeout
+
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            request, arrival, answer = await self.queue.get()
+            startTime = perf_counter()
+            try:
+                timeout = self.requestTimeout(request)
+                remaining = None
+                if (timeout != None):
+                    remaining = arrival + timeout - startTime
+                if (remaining != None and remaining <= 0):
+                    result = {"puzzle": request.get("id"), "status": "timed out", "solution": None, "seconds": 0.0}
+                else:
+                    job = (request.get("id"), puzzleLines(request), request.get("method", self.method),
+                           request.get("ordering", self.ordering), self.requestLimits(request, remaining),
+                           self.cachePath)
+                    self.inFlight += 1
+                    try:
+                        result = await loop.run_in_executor(self.pool, batch.solvePuzzle, job)
+                    finally:
+                        self.inFlight -= 1
+            except asyncio.CancelledError:
+                answer.cancel()
+                raise
+            except Exception as e:
+                result = {"puzzle": request.get("id"), "status": "error", "solution": None, "error": str(e)}
+            finishTime = perf_counter()
+            result["id"] = request.get("id")
+            result["queueSeconds"] = startTime - arrival
+            result["latency"] = finishTime - arrival
+            self.metrics.finished(result["status"], result["latency"], result["queueSeconds"])
+            if not answer.done():
+                answer.set_result(result)
+
+    async def serveLines(self, reader, writer):
+        """
+        Handles one connection of the line protocol
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if (line == b''):
+                    break
+                if (line.strip() == b''):
+                    continue
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                except ValueError as e:
+                    response = {"status": "error", "solution": None, "error": "bad request: " + str(e)}
+                else:
+                    if request.get("metrics"):
+                        response = self.getMetrics()
+                    else:
+                        response = await self.submit(request, wait=True)
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serveHTTP(self, reader, writer):
+        """
+        Handles one HTTP/1.1 connection, keeping it open between requests
+        unless the client asks otherwise
+        """
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if (requestLine.strip() == b''):
+                    break
+                headers = {}
+                while True:
+                    headerLine = await reader.readline()
+                    if (headerLine.strip() == b''):
+                        break
+                    name, separator, value = headerLine.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                parts = requestLine.decode("latin-1").split()
+                if (len(parts) != 3):
+                    await self.respond(writer, 400, {"status": "error", "error": "bad request line"}, False)
+                    break
+                verb, target, version = parts
+                keepAlive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                length = int(headers.get("content-length", "0"))
+                if (length > maxBodySize):
+                    await self.respond(writer, 413, {"status": "error", "error": "request body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length > 0 else b''
+                code, response = await self.handleHTTP(verb, target, headers, body)
+                await self.respond(writer, code, response, keepAlive)
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def handleHTTP(self, verb, target, headers, body):
+        """
+        Returns the (status code, JSON response) for one HTTP request
+        """
+        url = urlsplit(target)
+        if (url.path == "/metrics" and verb == "GET"):
+            return 200, self.getMetrics()
+        if (url.path != "/solve"):
+            return 404, {"status": "error", "error": "no such path: " + url.path}
+        if (verb != "POST"):
+            return 405, {"status": "error", "error": "use POST to solve"}
+        try:
+            text = body.decode("utf-8")
+            if headers.get("content-type", "").startswith("application/json"):
+                request = json.loads(text)
+                if not isinstance(request, dict):
+                    raise ValueError("request must be a JSON object")
+            else:
+                request = {"puzzle": text}
+            for name, values in parse_qs(url.query).items():
+                if name in ("id", "method", "ordering", "timeout", "nodes"):
+                    request[name] = values[-1]
+        except ValueError as e:
+            return 400, {"status": "error", "solution": None, "error": "bad request: " + str(e)}
+        response = await self.submit(request)
+        if (response["status"] == "busy"):
+            return 503, response
+        elif (response["status"] == "error"):
+            return 400, response
+        return 200, response
+
+    async def respond(self, writer, code, response, keepAlive):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                   413: "Payload Too Large", 503: "Service Unavailable"}
+        body = json.dumps(response).encode("utf-8")
+        head = ["HTTP/1.1 " + str(code) + " " + reasons[code],
+                "Content-Type: application/json",
+                "Content-Length: " + str(len(body)),
+                "Connection: " + ("keep-alive" if keepAlive else "close")]
+        if (code == 503):
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+async def serve(service, host="127.0.0.1", port=8765, socketPath=None):
+    """
+    Starts service and serves it over HTTP on host:port, and over the line
+    protocol on the Unix socket socketPath if given, until SIGINT or SIGTERM
+    """
+    await service.start()
+    servers = [await asyncio.start_server(service.serveHTTP, host, port)]
+    if (socketPath != None):
+        servers.append(await asyncio.start_unix_server(service.serveLines, socketPath))
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signalNumber in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signalNumber, stopping.set)
+    print("Serving on http://" + host + ":" + str(port) + ("" if socketPath == None else " and " + socketPath) +
+          " with " + str(service.processes) + " workers")
+    sys.stdout.flush()
+    try:
+        await stopping.wait()
+    finally:
+        for server in servers:
+            server.close()
+            await server.wait_closed()
+        await service.stop()
+
+def parseArguments(args):
+    """
+    Turns service.py's arguments into a dictionary of flag -> value
+    """
+    options = {}
+    i = 0
+    while (i < len(args)):
+        if (args[i] in ("-H", "-P", "-u", "-p", "-q", "-m", "-v", "-t", "-n", "-k") and i + 1 < len(args)):
+            options[args[i]] = args[i+1]
+            i += 2
+        else:
+            raise ValueError("usage: service.py [-H HOST] [-P PORT] [-u SOCKETPATH] [-p PROCESSES] [-q QUEUESIZE] "
+                             "[-m METHOD] [-v ORDERING] [-t TIMEOUT] [-n NODES] [-k CACHEFILE]")
+    return options
+
+def main(args):
+    options = parseArguments(args)
+    processes = options.get("-p")
+    if (processes != None):
+        processes = int(processes)
+    timeout = options.get("-t")
+    if (timeout != None):
+        timeout = float(timeout)
+    maxNodes = options.get("-n")
+    if (maxNodes != None):
+        maxNodes = int(maxNodes)
+    service = SolvingService(processes, int(options.get("-q", 64)), options.get("-m"), options.get("-v"),
+                             timeout, maxNodes, options.get("-k"))
+    asyncio.run(serve(service, options.get("-H", "127.0.0.1"), int(options.get("-P", 8765)), options.get("-u")))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+from time import perf_counter
+
+class SolverStats:
+    """
+    Work counters kept by every solver in solver.stats
+        nodes             - search nodes visited
+        backtracks        - branches that failed and had to be undone
+        revisions         - (Coordinate, Constraint) pairs taken off the queue
+        valuesPruned      - values removed from domains by propagation
+        constraintChecks  - valuesSatisfyConstraint calls made by the solver
+        queuePushes       - (Coordinate, Constraint) pairs put on the queue
+        maxDepth          - deepest branching level reached
+        backjumps         - failures that skipped the untried values of a level
+        nogoodPrunes      - values skipped because they matched a learned nogood
+        probes            - values tried on their own by lookahead probing
+        probePrunes       - values removed because their probe wiped out a domain
+        restarts          - times the search started over from the root
+        rulesFired        - values removed by each presolve rule, by rule name
+                            (see presolve.py)
+        phaseTimes        - seconds spent in each phase, by phase name
+    """
+    def __init__(self):
+        self.nodes = 0
+        self.backtracks = 0
+        self.revisions = 0
+        self.valuesPruned = 0
+        self.constraintChecks = 0
+        self.queuePushes = 0
+        self.maxDepth = 0
+        self.backjumps = 0
+        self.nogoodPrunes = 0
+        self.probes = 0
+        self.probePrunes = 0
+        self.restarts = 0
+        self.rulesFired = {}
+        self.phaseTimes = {}
+
+    def addPhaseTime(self, phase, startTime):
+        """
+        Adds the time since startTime (a perf_counter() reading) to phase
+        """
+        self.phaseTimes[phase] = self.phaseTimes.get(phase, 0.0) + perf_counter() - startTime
+
+    def asDict(self):
+        return {"nodes": self.nodes, "backtracks": self.backtracks, "revisions": self.revisions,
+                "valuesPruned": self.valuesPruned, "constraintChecks": self.constraintChecks,
+                "queuePushes": self.queuePushes, "maxDepth": self.maxDepth,
+                "backjumps": self.backjumps, "nogoodPrunes": self.nogoodPrunes,
+                "probes": self.probes, "probePrunes": self.probePrunes, "restarts": self.restarts,
+                "rulesFired": dict(self.rulesFired),
+                "phaseTimes": dict(self.phaseTimes)}
+
+    def __repr__(self):
+        return "SolverStats(" + repr(self.asDict()) + ")"
+
+
+class SolverObserver:
+    """
+    Base class for objects that want to follow a solver as it runs.
+    Pass one to a solver's constructor and override the events you care
+    about; all of them do nothing by default.  Solvers skip the calls
+    entirely when no observer is given.
+    """
+    def onBranch(self, coordinate, value, depth):
+        """
+        coordinate is about to be tried with value, depth levels into the search
+        """
+
+    def onPrune(self, coordinate, removedBits, constraint):
+        """
+        constraint removed the values in the bitmask removedBits from coordinate
+        (constraint is None when a lookahead probe of them failed, and for
+        the vectorized solver)
+        """
+
+    def onWipeOut(self, coordinate, constraint):
+        """
+        constraint left coordinate with no values (or, for BackTrack,
+        constraint was found broken at coordinate's assignment; the
+        vectorized solver fails whole nodes and gives None for both)
+        """
+
+    def onSolution(self, solver):
+        """
+        solver found a solution; the values are set on the board's Coordinates
+        """
+
+
+def percentile(sortedValues, fraction):
+    """
+    Linearly interpolated percentile of an already sorted list, or None
+    for an empty list.  Used for benchmark.py's timings and service.py's
+    latencies.
+    >>> percentile([1.0, 2.0, 3.0, 4.0], 0.5)
+    2.5
+    >>> percentile([5.0], 0.9), percentile([], 0.5)
+    (5.0, None)
+    """
+    if (len(sortedValues) == 0):
+        return None
+    position = (len(sortedValues) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sortedValues) - 1)
+    return sortedValues[lower] + (sortedValues[upper] - sortedValues[lower]) * (position - lower)
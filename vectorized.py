@@ -0,0 +1,400 @@
+#############################################################
+# NumPy-vectorized KenKen solving                           #
+#                                                           #
+# Holds the domains of a search node as an n x n x n        #
+# boolean array (domains[x][y][v-1] is True IFF v is still  #
+# possible at (x,y)), and propagates with array reductions  #
+# instead of per-Coordinate loops:                          #
+#   - singletons are eliminated from their row and column   #
+#   - a value with one place left in a row or column is     #
+#     placed there (hidden singles)                         #
+#   - every cage's tuple table (see constraint.py) is       #
+#     checked against the domains in one gather             #
+#   - add/mul cages too large for a table are narrowed by   #
+#     their sum and product bounds, one node at a time      #
+# Propagation works on a stack of nodes at once, possibly   #
+# of different puzzles of the same size, so the search      #
+# expands several nodes per array operation, and many       #
+# boards can be solved side by side with solveBoards.       #
+#                                                           #
+# Needs NumPy; selected with -m vectorized.                 #
+#                                                           #
+# Usage:                                                    #
+#   python vectorized.py PUZZLE.kk...                       #
+# solves each puzzle with both this engine and              #
+# arcConsistency and reports whether they agree: valid      #
+# solutions, and the same solution count (up to 2).         #
+#############################################################
+
+import sys
+from time import perf_counter
+import kenken
+import constraint
+from stats import SolverStats
+from limits import LimitReached
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class CageArrays:
+    """
+    The cages of one Board as arrays, grouped by the number of cells:
+    for each cage size m, X, Y and T have one row per satisfying tuple
+    of every cage with m cells, holding the cells' x and y and the tuple's
+    values minus 1.  cellX and cellY list every cell of those cages.
+    Add and mul cages too large for a tuple table (see
+    constraint.tupleTableLimit) are left out of the arrays: arithmetic
+    holds (cage, locations) for each of them instead, see
+    narrowArithmetic.
+    """
+    def __init__(self, board):
+        groups = {}
+        cells = []
+        self.arithmetic = []
+        for boardConstraint in board.getConstraints():
+            if not isinstance(boardConstraint, constraint.ArithmeticConstraint):
+                continue
+            locations = [(coord.getX(), coord.getY()) for coord in boardConstraint.getCoordinates()]
+            if not boardConstraint.useTable:
+                self.arithmetic.append((boardConstraint, locations))
+                continue
+            cells.extend(locations)
+            rows = groups.setdefault(len(locations), ([], [], []))
+            for instance in boardConstraint.getTuples():
+                rows[0].append([x for x, y in locations])
+                rows[1].append([y for x, y in locations])
+                rows[2].append([value.bit_length() - 2 for value in instance])
+        self.groups = {}
+        for m, (xs, ys, ts) in groups.items():
+            self.groups[m] = (numpy.array(xs, dtype=numpy.intp).reshape(-1, m),
+                              numpy.array(ys, dtype=numpy.intp).reshape(-1, m),
+                              numpy.array(ts, dtype=numpy.intp).reshape(-1, m))
+        self.cellX = numpy.array([x for x, y in cells], dtype=numpy.intp)
+        self.cellY = numpy.array([y for x, y in cells], dtype=numpy.intp)
+
+
+def nodeRows(cageArrays, owners):
+    """
+    Lines the cage tables up with a stack of nodes, where node b belongs
+    to the puzzle cageArrays[owners[b]].  Returns (covered, groups) where
+    covered[b][x][y] is True for caged cells, and groups holds, per cage
+    size, the node index, X, Y and T of every (node, tuple) row.
+    """
+    pieces = {}
+    coveredNodes, coveredX, coveredY = [], [], []
+    for owner in set(owners):
+        arrays = cageArrays[owner]
+        nodes = numpy.flatnonzero(numpy.asarray(owners) == owner)
+        coveredNodes.append(numpy.repeat(nodes, len(arrays.cellX)))
+        coveredX.append(numpy.tile(arrays.cellX, len(nodes)))
+        coveredY.append(numpy.tile(arrays.cellY, len(nodes)))
+        for m, (X, Y, T) in arrays.groups.items():
+            piece = pieces.setdefault(m, ([], [], [], []))
+            piece[0].append(numpy.repeat(nodes, len(X)))
+            piece[1].append(numpy.tile(X, (len(nodes), 1)))
+            piece[2].append(numpy.tile(Y, (len(nodes), 1)))
+            piece[3].append(numpy.tile(T, (len(nodes), 1)))
+    groups = [tuple(numpy.concatenate(part) for part in piece) for piece in pieces.values()]
+    return (numpy.concatenate(coveredNodes), numpy.concatenate(coveredX), numpy.concatenate(coveredY)), groups
+
+def propagate(domains, cageArrays, owners, stats=None):
+    """
+    Runs every propagation rule on a stack of nodes (domains has shape
+    (nodes, n, n, n)) until none of them changes anything.  owners[b] is
+    the index in cageArrays of node b's puzzle.
+    Returns (domains, failed) where failed[b] is True if node b had a
+    domain wiped out; failed nodes are left with every domain empty.
+    """
+    (coveredNodes, coveredX, coveredY), groups = nodeRows(cageArrays, owners)
+    covered = numpy.zeros(domains.shape[:3], dtype=bool)
+    covered[coveredNodes, coveredX, coveredY] = True
+    covered = covered[..., None]
+    failed = numpy.zeros(len(domains), dtype=bool)
+    while True:
+        before = domains
+        if (stats != None):
+            stats.revisions += 1
+        #Singletons leave their row and column; two equal singletons in a line fail
+        counts = domains.sum(axis=3)
+        singles = domains & (counts == 1)[..., None]
+        columnSingles = singles.sum(axis=2)
+        rowSingles = singles.sum(axis=1)
+        failed |= (counts == 0).any(axis=(1, 2))
+        failed |= (columnSingles > 1).any(axis=(1, 2)) | (rowSingles > 1).any(axis=(1, 2))
+        taken = (columnSingles > 0)[:, :, None, :] | (rowSingles > 0)[:, None, :, :]
+        domains = domains & (~taken | singles)
+        #Hidden singles: a value with one place left in a line goes there
+        columnPlaces = domains.sum(axis=2)
+        rowPlaces = domains.sum(axis=1)
+        failed |= (columnPlaces == 0).any(axis=(1, 2)) | (rowPlaces == 0).any(axis=(1, 2))
+        hidden = domains & ((columnPlaces == 1)[:, :, None, :] | (rowPlaces == 1)[:, None, :, :])
+        domains = numpy.where(hidden.any(axis=3)[..., None], hidden, domains)
+        #Cages: keep the values of the tuples that still fit the domains
+        supported = numpy.zeros_like(domains)
+        for nodes, X, Y, T in groups:
+            fits = domains[nodes[:, None], X, Y, T].all(axis=1)
+            supported[nodes[fits][:, None], X[fits], Y[fits], T[fits]] = True
+        domains = numpy.where(covered, domains & supported, domains)
+        #Cages without a table, by their sum and product bounds
+        for b in range(len(domains)):
+            if not failed[b]:
+                for cage, locations in cageArrays[owners[b]].arithmetic:
+                    narrowArithmetic(domains[b], cage, locations)
+        domains[failed] = False
+        if (stats != None):
+            stats.valuesPruned += int(before.sum() - domains.sum())
+        if numpy.array_equal(domains, before):
+            return domains, failed
+
+def narrowArithmetic(domains, cage, locations):
+    """
+    Narrows one node's domains (an n x n x n array, changed in place) at
+    the cage's locations to the values ArithmeticConstraint.supportedBits
+    keeps, as the other solvers do for cages too large for a tuple table
+    """
+    bits = [bitsOf(domains[x, y]) for x, y in locations]
+    for position in range(len(locations)):
+        supported = bits[position] & cage.supportedBits(bits, position)
+        if (supported != bits[position]):
+            bits[position] = supported
+            x, y = locations[position]
+            domains[x, y] = [(supported >> value) & 1 for value in range(1, len(domains) + 1)]
+
+def bitsOf(values):
+    """
+    Returns a boolean value array (values[v-1] is True IFF v is possible)
+    as a Coordinate domain bitmask
+    """
+    bits = 0
+    for value in numpy.flatnonzero(values):
+        bits |= 2 << int(value)
+    return bits
+
+
+class VectorizedSolver:
+    """
+    Depth first search over NumPy domain arrays, propagating up to width
+    nodes together at each step.  Branches on the cell with the fewest
+    values left, ties going to the first in row order as with mrv in
+    arcConsistency, smallest value first.  Has the same interface as the
+    other solvers, but the branching is always mrv: any ordering other
+    than None or "mrv" is refused with a ValueError.  An observer gets every event, but a whole batch is
+    propagated at once, so onPrune and onWipeOut name no constraint, and
+    onWipeOut no coordinate either.
+    """
+    def __init__(self, board, ordering=None, observer=None, limits=None, width=8):
+        if (numpy == None):
+            raise ImportError("the vectorized method needs NumPy (pip install numpy)")
+        if (ordering != None and ordering != "mrv"):
+            raise ValueError("the vectorized method always branches by mrv, it cannot use ordering " + str(ordering))
+        self.board = board
+        self.ordering = ordering
+        self.observer = observer
+        self.limits = limits
+        self.width = width
+        self.stats = SolverStats()
+        self.coordinates = list(board.getCoordinates())
+
+    def solve(self):
+        """
+        Returns True if a solution is found (it is left in the Coordinate
+        values), False if there is none, or a (falsy) LimitReached if one of
+        the solver's limits stopped the search.
+        """
+        return solveBoards([self.board], self.width, self.stats, self.limits, self)[0]
+
+    def countSolutions(self, limit=None):
+        """
+        Returns the number of solutions, stopping as soon as limit of them
+        have been found, as arcConsistency.countSolutions does.  If one of
+        the solver's limits is hit, LimitReached is raised.
+        """
+        results, found = searchBoards([self.board], self.width, self.stats, self.limits, self, limit)
+        if isinstance(results[0], LimitReached):
+            raise results[0]
+        return found[0]
+
+
+def boardDomains(board):
+    """
+    Returns a Board's current Coordinate domains as an n x n x n array
+    """
+    size = board.getSize()
+    domains = numpy.zeros((size, size, size), dtype=bool)
+    for coord in board.getCoordinates():
+        for value in coord.getDomain():
+            domains[coord.getX(), coord.getY(), value - 1] = True
+    return domains
+
+def solveBoards(boards, width=8, stats=None, limits=None, solver=None):
+    """
+    Solves several Boards of the same size (ValueError otherwise) together: nodes of all of them
+    share one search stack, and up to width nodes (of any of the boards)
+    are propagated in each array operation.  Returns one result per board,
+    True, False or a LimitReached as from a solver's solve(); solutions are
+    left in the Coordinate values.  stats is the SolverStats to count into,
+    and solver the VectorizedSolver to report to its observer, if any.
+    """
+    return searchBoards(boards, width, stats, limits, solver, 1)[0]
+
+def searchBoards(boards, width, stats, limits, solver, solutionLimit):
+    """
+    The search behind solveBoards, going on until solutionLimit solutions
+    of each board have been found (all of them when it is None).  Returns
+    (results, found): the results as from solveBoards, and the number of
+    solutions found for each board.  The first solution of each board is
+    left in its Coordinate values.
+    """
+    if (numpy == None):
+        raise ImportError("the vectorized method needs NumPy (pip install numpy)")
+    sizes = sorted(set(board.getSize() for board in boards))
+    if (len(sizes) > 1):
+        raise ValueError("boards solved together must all have the same size, not " +
+                         ", ".join(str(size) for size in sizes))
+    if (stats == None):
+        stats = SolverStats()
+    if (limits != None):
+        limits.start()
+    cageArrays = [CageArrays(board) for board in boards]
+    results = [False] * len(boards)
+    found = [0] * len(boards)
+    #Boards whose search is over
+    done = [False] * len(boards)
+    observer = None
+    if (solver != None):
+        observer = solver.observer
+    #Stack of (owner, depth, domains, branch), branch being the (x, y, value
+    #index) the node was branched on; the top is the end of the list
+    stack = [(owner, 0, boardDomains(boards[owner]), None) for owner in reversed(range(len(boards)))]
+    try:
+        while (len(stack) != 0):
+            batch = []
+            while (len(stack) != 0 and len(batch) < width):
+                node = stack.pop()
+                if not done[node[0]]:
+                    batch.append(node)
+            if (len(batch) == 0):
+                break
+            stats.nodes += len(batch)
+            if (limits != None):
+                limits.check(stats)
+            owners = [node[0] for node in batch]
+            if (observer != None):
+                for owner, depth, domains, branch in batch:
+                    if (branch != None):
+                        x, y, value = branch
+                        observer.onBranch(boards[owner].getCoordinate(x, y), value + 1, depth - 1)
+            startTime = perf_counter()
+            domains, failed = propagate(numpy.stack([node[2] for node in batch]), cageArrays, owners, stats)
+            stats.addPhaseTime("propagation", startTime)
+            if (observer != None):
+                reportPropagation(boards, batch, domains, failed, observer)
+            counts = domains.sum(axis=3)
+            children = []
+            for b in range(len(batch)):
+                owner, depth = owners[b], batch[b][1]
+                stats.maxDepth = max(stats.maxDepth, depth)
+                if done[owner]:
+                    continue
+                if failed[b]:
+                    stats.backtracks += 1
+                    continue
+                if (counts[b] == 1).all():
+                    found[owner] += 1
+                    if (found[owner] == 1):
+                        recordSolution(boards[owner], domains[b], solver)
+                    results[owner] = True
+                    if (solutionLimit != None and found[owner] >= solutionLimit):
+                        done[owner] = True
+                    continue
+                #Branch on the cell with the fewest values left, first in row order on ties
+                remaining = numpy.where(counts[b] > 1, counts[b], domains.shape[3] + 1).T
+                y, x = numpy.unravel_index(numpy.argmin(remaining), remaining.shape)
+                for value in numpy.flatnonzero(domains[b, x, y]):
+                    child = domains[b].copy()
+                    child[x, y] = False
+                    child[x, y, value] = True
+                    children.append((owner, depth + 1, child, (x, y, value)))
+            #The first popped node's smallest value ends up on top of the stack
+            stack.extend(reversed(children))
+    except LimitReached as limit:
+        for owner in range(len(boards)):
+            if not done[owner]:
+                results[owner] = LimitReached(limit.reason)
+                results[owner].stats = stats
+                results[owner].domains = dict(((coord.getX(), coord.getY()), list(coord.getDomain()))
+                                              for coord in boards[owner].getCoordinates())
+    return results, found
+
+def reportPropagation(boards, batch, domains, failed, observer):
+    """
+    Tells observer what propagating batch, a list of stack nodes, did:
+    onPrune for every cell it narrowed and onWipeOut for every node
+    that failed
+    """
+    for b in range(len(batch)):
+        owner, depth, before = batch[b][:3]
+        if failed[b]:
+            observer.onWipeOut(None, None)
+            continue
+        removed = before & ~domains[b]
+        for x, y in zip(*numpy.nonzero(removed.any(axis=2))):
+            observer.onPrune(boards[owner].getCoordinate(int(x), int(y)), bitsOf(removed[x, y]), None)
+
+def recordSolution(board, domains, solver=None):
+    """
+    Copies a solved node's values onto the board's Coordinates
+    """
+    for coord in board.getCoordinates():
+        value = int(numpy.flatnonzero(domains[coord.getX(), coord.getY()])[0]) + 1
+        coord.setDomainBits(1 << value)
+        coord.setValue(value)
+    if (solver != None and solver.observer != None):
+        solver.observer.onSolution(solver)
+
+def crossCheck(kenkenLines):
+    """
+    Solves a puzzle with both arcConsistency and the vectorized engine.
+    Returns True IFF they agree: each finds a solution that satisfies every
+    constraint, or neither finds one, and they count the same number of
+    solutions up to 2.  The solutions themselves are not compared: the two
+    engines propagate differently, so on a puzzle with several solutions
+    they can branch differently and find different ones.
+    """
+    puzzle = kenken.parsePuzzle(kenkenLines)
+    answers = []
+    for method in ("arcCon", "vectorized"):
+        board = kenken.buildBoardFromPuzzle(puzzle)
+        solved = kenken.makeSolver(board, method)()
+        if (solved == True and not satisfiesEveryConstraint(board)):
+            return False
+        counter = kenken.createSolver(kenken.buildBoardFromPuzzle(puzzle), method)[0]
+        answers.append((solved == True, counter.countSolutions(2)))
+    return answers[0] == answers[1]
+
+def satisfiesEveryConstraint(board):
+    """
+    True IFF the values on the board satisfy every row, column and cage
+    """
+    for boardConstraint in board.getConstraints():
+        values = [coord.getValue() for coord in boardConstraint.getCoordinates()]
+        if (None in values or not boardConstraint.valuesSatisfyConstraint(values)):
+            return False
+    return True
+
+def main(args):
+    if (len(args) == 0):
+        raise ValueError("usage: vectorized.py PUZZLE.kk...")
+    mismatches = 0
+    for kenkenFileName in args:
+        if crossCheck(kenken.readLayout(kenkenFileName)):
+            print(kenkenFileName + ": OK")
+        else:
+            print(kenkenFileName + ": MISMATCH")
+            mismatches += 1
+    return mismatches
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))